@@ -3,19 +3,46 @@ from django.utils.html import format_html
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.contrib import admin
-from django.utils import timezone
-from datetime import timedelta
-from .models import PaymentRequest, UserProfile, ShopOwnerProfile, Coupon
+from django.db.models import Q
+from .models import PaymentRequest, UserProfile, ShopOwnerProfile
 from .models import Register
+from . import jobs
+from .backends import users_matching
+from .entitlements import confirm_payments
+from .listing import EstimatedCountPaginator
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    # The user is joined into the list query rather than fetched per row,
+    # and large unfiltered lists aren't counted row by row.
+    list_select_related = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-id',)
+    search_help_text = "Exact username or email, case-insensitive."
+
+    def get_search_results(self, request, queryset, search_term):
+        # Equality on the UPPER(username)/UPPER(email) indexes instead of the
+        # default LIKE '%term%' scans across the join.
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return queryset.filter(self.search_condition(term)), False
+
+    def search_condition(self, term):
+        return Q(user__in=users_matching(username=term, email=term))
+
 
 @admin.register(Register)
-class RegisterAdmin(admin.ModelAdmin):
+class RegisterAdmin(ScalableAdmin):
     list_display = ('user', 'date_registered')
+    search_fields = ('user__username',)
 
 
 @admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
+class UserProfileAdmin(ScalableAdmin):
     list_display = ('user', 'package_active', 'plan_expiration_date', 'delete_coupons_button')
+    search_fields = ('user__username',)
 
     def get_urls(self):
         urls = super().get_urls()
@@ -31,7 +58,7 @@ class UserProfileAdmin(admin.ModelAdmin):
     def delete_coupons_button(self, obj):
         return format_html(
             '<a class="button" href="{}">Delete All Coupons</a>',
-            f'./delete-coupons/{obj.user.id}/'
+            f'./delete-coupons/{obj.user_id}/'
         )
     delete_coupons_button.short_description = 'Delete Coupons'
     delete_coupons_button.allow_tags = True
@@ -42,35 +69,25 @@ class UserProfileAdmin(admin.ModelAdmin):
             return redirect('..')
         try:
             owner = ShopOwnerProfile.objects.get(user__id=user_id)
-            count, _ = Coupon.objects.filter(owner=owner).delete()
-            self.message_user(request, f"Deleted {count} coupons for user.", level=messages.SUCCESS)
+            jobs.enqueue(owner, jobs.DELETE)
+            self.message_user(request, "Deleting this user's coupons in the background.", level=messages.SUCCESS)
         except ShopOwnerProfile.DoesNotExist:
             self.message_user(request, "ShopOwnerProfile not found.", level=messages.WARNING)
         return redirect('..')
 
 
 @admin.register(PaymentRequest)
-class PaymentRequestAdmin(admin.ModelAdmin):
+class PaymentRequestAdmin(ScalableAdmin):
     list_display = ('user', 'upi_name', 'upi_id', 'is_confirmed', 'created_at', 'confirmed_at')
     list_filter = ('is_confirmed', 'created_at')
-    search_fields = ('user__username', 'upi_name', 'upi_id')
+    search_fields = ('user__username', 'upi_id')
+    search_help_text = "Exact UPI ID, username or email."
     actions = ['mark_as_confirmed']
 
+    def search_condition(self, term):
+        return Q(upi_id=term) | super().search_condition(term)
+
     def mark_as_confirmed(self, request, queryset):
-        updated_count = 0
-        today = timezone.now().date()
-        for payment in queryset.filter(is_confirmed=False):
-            payment.is_confirmed = True
-            payment.confirmed_at = timezone.now()
-            payment.save()
-            profile = getattr(payment.user, 'userprofile', None)
-            if profile:
-                profile.package_active = True
-                if not profile.plan_expiration_date or profile.plan_expiration_date < today:
-                    profile.plan_expiration_date = today + timedelta(days=30)
-                else:
-                    profile.plan_expiration_date += timedelta(days=30)
-                profile.save()
-            updated_count += 1
+        updated_count = confirm_payments(queryset)
         self.message_user(request, f"{updated_count} payment(s) confirmed and packages activated/extended.")
     mark_as_confirmed.short_description = "Mark selected payments as confirmed and activate/extend package"
@@ -0,0 +1,66 @@
+"""Async twins of the kiosk endpoints, for deployments served through asgi.py.
+
+Under ASGI these don't hold a worker while the database answers. The
+redemption write itself still runs as one sync transaction via
+sync_to_async, because Django's async ORM can't open a transaction.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.db import DatabaseError
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from . import codefilter, signedcodes
+from .models import ShopOwnerProfile, Coupon
+from .redemption import INVALID, check_signed, redeem_draw
+from .views import coupon_verdict, verdict_response
+
+
+@login_required
+async def validate_coupon(request):
+    code = request.GET.get("coupon", "").strip()
+    if not code:
+        return JsonResponse({"valid": False, "message": "Coupon code required."})
+
+    owner_id = await request.session.aget("_owner_id")
+    if owner_id is None:
+        user = await request.auser()
+        owner_id = await ShopOwnerProfile.objects.filter(user=user).values_list("id", flat=True).afirst()
+        if owner_id is not None:
+            await request.session.aset("_owner_id", owner_id)
+    if signedcodes.is_signed(code):
+        return verdict_response(check_signed(code, owner_id) if owner_id else INVALID)
+
+    if not owner_id:
+        return coupon_verdict(None)
+    if not await sync_to_async(codefilter.might_exist)(owner_id, code):
+        return coupon_verdict(None)
+
+    coupon_obj = await Coupon.objects.filter(code=code, owner_id=owner_id).values("status", "expiry_date").afirst()
+    if coupon_obj is None:
+        codefilter.record_false_positive()
+    return coupon_verdict(coupon_obj)
+
+
+@csrf_exempt
+async def redeem_coupon(request):
+    if request.method != "POST":
+        return JsonResponse({"success": False, "message": "Invalid request method."})
+
+    code = request.POST.get("coupon")
+    name = request.POST.get("name")
+    contact = request.POST.get("contact")
+    owner_id = request.POST.get("owner_id")
+
+    if not owner_id and code:
+        owner_id = await Coupon.objects.filter(code=code).values_list("owner_id", flat=True).afirst()
+
+    if not all([code, name, contact, owner_id]):
+        return JsonResponse({"success": False, "message": "All fields are required."})
+
+    # As in the sync view, the prize is always drawn server-side.
+    try:
+        result = await sync_to_async(redeem_draw)(int(owner_id), code, name, contact)
+    except (ValueError, DatabaseError) as e:
+        return JsonResponse({"success": False, "message": f"Redemption failed: {str(e)}"})
+    return JsonResponse(dict(result.as_json(), prize_id=result.winner.prize_id if result.winner else None))
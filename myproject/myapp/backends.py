@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q, Value
+from django.db.models.functions import Upper
+
+UserModel = get_user_model()
+
+
+def users_matching(username=None, email=None):
+    """Users whose username or email equals the given ones, ignoring case.
+
+    Compares `UPPER(column)` so the lookups hit the functional indexes from
+    migration 0006 instead of scanning `auth_user` with LIKE.
+    """
+    condition = Q()
+    if username is not None:
+        condition |= Q(username_upper=Upper(Value(username)))
+    if email is not None:
+        condition |= Q(email_upper=Upper(Value(email)))
+    return UserModel.objects.alias(username_upper=Upper('username'), email_upper=Upper('email')).filter(condition)
+
+
+class EmailBackend(ModelBackend):
+    """Authenticate with an email address and password in one user query."""
+
+    def authenticate(self, request, email=None, password=None, **kwargs):
+        if email is None or password is None:
+            return None
+        # Older accounts may share an address; try each of them.
+        candidates = list(users_matching(email=email).order_by('pk'))
+        if not candidates:
+            # Run the hasher anyway so unknown addresses take as long as known ones.
+            UserModel().set_password(password)
+            return None
+        for user in candidates:
+            if user.check_password(password) and self.user_can_authenticate(user):
+                return user
+        return None
@@ -0,0 +1,82 @@
+"""Per-owner prize catalogue cache for the spin pages and prize management.
+
+The catalogue is a plain list of dicts (id, name, weight, stock and the
+image URLs the templates need), cached under a key that carries the
+owner's catalogue version. Saving or deleting a prize, or taking the last
+unit of its stock, bumps the version; readers then miss and rebuild, and
+stale entries simply age out. Nothing is deleted, so a reader that raced a
+writer can't leave old data in place under the new version. A cached
+`stock` only says whether a prize has run out; pages that show the count
+read it live.
+
+A version is a random token, and a bump writes a new one with a single
+`set`. Caches such as the file cache implement `incr` as an unlocked
+read-modify-write, so two bumps at once could collapse into one; two fresh
+tokens can't, and no version is ever reused.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Prize
+from .templatetags.prize_images import prize_image_url, prize_srcset
+
+
+def _version_key(owner_id):
+    return f'prize-catalogue-version:{owner_id}'
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def catalogue_version(owner_id):
+    key = _version_key(owner_id)
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_catalogue_version(owner_id):
+    key = _version_key(owner_id)
+
+    def bump():
+        cache.set(key, _new_version(), None)
+
+    # Once now, and again after commit so nothing cached from pre-commit
+    # rows survives under the current version.
+    bump()
+    transaction.on_commit(bump)
+
+
+def _entry(prize):
+    return {
+        'id': prize.pk,
+        'name': prize.name,
+        'weight': prize.weight,
+        'stock': prize.stock,
+        'has_image': bool(prize.image),
+        'image_url': prize_image_url(prize, 320),
+        'card_url': prize_image_url(prize, 640),
+        'webp_srcset': prize_srcset(prize, 'webp'),
+        'jpeg_srcset': prize_srcset(prize, 'jpeg'),
+    }
+
+
+def prize_catalogue(owner_id):
+    """The owner's prizes, oldest first, as cached dicts."""
+    key = f'prize-catalogue:{owner_id}:{catalogue_version(owner_id)}'
+    prizes = cache.get(key)
+    if prizes is None:
+        prizes = [_entry(prize) for prize in Prize.objects.filter(owner_id=owner_id).order_by('pk')]
+        cache.set(key, prizes, getattr(settings, 'PRIZE_CATALOGUE_CACHE_TIMEOUT', 3600))
+    return prizes
+
+
+def is_drawable(entry):
+    return entry['weight'] > 0 and entry['stock'] != 0
@@ -0,0 +1,141 @@
+"""In-process Bloom filter of issued coupon codes, one per owner.
+
+Lets `validate_coupon` reject codes that were never issued without querying
+the coupon table. A Bloom filter has no false negatives, so a "no" is final;
+a "maybe" still goes to the database.
+
+Freshness is tracked with a per-owner generation token in the shared
+cache, so a lookup costs no query at all. Each generation of codes writes a
+new token once it commits, and a filter built at another token is rebuilt
+from the database first; the token is read before the rebuild's query, so a
+filter never misses codes committed before its token. A fresh token is
+`set` rather than `incr`-ed because caches such as the file cache increment
+with an unlocked read-modify-write. For the same reason the generating
+process doesn't extend its own filter: it can't tell whether another
+generation slipped in, so it rebuilds like everyone else. Deleted codes
+stay in the filter until it is rebuilt, which only costs a DB lookup,
+never a wrong answer.
+"""
+import hashlib
+import math
+import threading
+import uuid
+
+from django.core.cache import cache
+
+from .models import Coupon
+
+FALSE_POSITIVE_RATE = 0.01
+MIN_CAPACITY = 1024
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+    @property
+    def full(self):
+        return self.count > self.capacity
+
+
+class _OwnerCodes:
+    def __init__(self, bloom, generation):
+        self.bloom = bloom
+        self.generation = generation
+
+
+_filters = {}
+_lock = threading.Lock()
+counters = {'lookups': 0, 'rejected': 0, 'passed': 0, 'false_positives': 0}
+
+
+def _generation_key(owner_id):
+    return f'coupon-codes-generation:{owner_id}'
+
+
+def generation(owner_id):
+    key = _generation_key(owner_id)
+    token = cache.get(key)
+    if token is None:
+        token = uuid.uuid4().hex
+        if not cache.add(key, token, None):
+            token = cache.get(key, token)
+    return token
+
+
+def bump_generation(owner_id):
+    """Mark every process's filter for `owner_id` stale; call once new codes are committed."""
+    cache.set(_generation_key(owner_id), uuid.uuid4().hex, None)
+
+
+def _build(owner_id, generation):
+    codes = Coupon.objects.filter(owner_id=owner_id).values_list('code', flat=True)
+    bloom = BloomFilter(max(MIN_CAPACITY, 2 * codes.count()))
+    for code in codes.iterator(chunk_size=5000):
+        bloom.add(code)
+    return _OwnerCodes(bloom, generation)
+
+
+def _stale(entry, generation):
+    return entry is None or entry.generation != generation or entry.bloom.full
+
+
+def _filter_for(owner_id, generation):
+    with _lock:
+        entry = _filters.get(owner_id)
+    if not _stale(entry, generation):
+        return entry
+    # Built without the lock, so other lookups don't wait behind one owner's
+    # query; two threads rebuilding the same owner only duplicate work.
+    built = _build(owner_id, generation)
+    with _lock:
+        entry = _filters.get(owner_id)
+        if _stale(entry, generation):
+            entry = _filters[owner_id] = built
+        return entry
+
+
+def _count(name):
+    with _lock:
+        counters[name] += 1
+
+
+def might_exist(owner_id, code):
+    """False only if `code` was definitely never issued to this owner."""
+    entry = _filter_for(owner_id, generation(owner_id))
+    found = code in entry.bloom
+    _count('lookups')
+    _count('passed' if found else 'rejected')
+    return found
+
+
+def record_false_positive():
+    _count('false_positives')
+
+
+def discard(owner_id):
+    """Forget an owner's filter, e.g. after their coupons were deleted."""
+    with _lock:
+        _filters.pop(owner_id, None)
+
+
+def snapshot():
+    return dict(counters, owners=len(_filters))
@@ -0,0 +1,6 @@
+from .pagecache import template_version
+
+
+def layout(request):
+    # Part of the `{% cache %}` keys of the shared layout fragments.
+    return {'template_version': template_version()}
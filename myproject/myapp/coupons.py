@@ -0,0 +1,168 @@
+import hashlib
+import string
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .listing import parse_date_param
+from .models import Coupon, CouponCodeSequence, ShopOwnerProfile
+from . import codefilter, rollups, signedcodes
+from .stats import invalidate_owner_stats
+
+COUPON_CODE_LENGTH = 8
+COUPON_CODE_ALPHABET = string.ascii_uppercase + string.digits
+
+# Kept below SQLite's 999 bound-parameter limit so a batch fits in one
+# statement group.
+COUPON_BATCH_SIZE = 500
+
+# Codes are an 8-char base-36 encoding of a Feistel permutation over
+# [0, 36**8). Each half of the network covers 36**4 values, so the domain is
+# covered exactly and no cycle-walking is needed.
+_HALF_SPACE = len(COUPON_CODE_ALPHABET) ** (COUPON_CODE_LENGTH // 2)
+CODE_SPACE = _HALF_SPACE ** 2
+_FEISTEL_ROUNDS = 6
+
+
+def _code_key():
+    # Changing the key restarts the permutation, so previously issued codes
+    # are no longer guaranteed to be distinct from new ones.
+    key = getattr(settings, 'COUPON_CODE_KEY', settings.SECRET_KEY)
+    return hashlib.sha256(key.encode()).digest()
+
+
+def _round(key, i, value):
+    digest = hashlib.blake2b(b'%d:%d' % (i, value), key=key, digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % _HALF_SPACE
+
+
+def permute(n, key=None):
+    """Map a counter value to a unique, unpredictable value in the code space."""
+    key = key or _code_key()
+    left, right = divmod(n, _HALF_SPACE)
+    for i in range(_FEISTEL_ROUNDS):
+        left, right = right, (left + _round(key, i, right)) % _HALF_SPACE
+    return left * _HALF_SPACE + right
+
+
+def encode_code(n):
+    chars = []
+    for _ in range(COUPON_CODE_LENGTH):
+        n, digit = divmod(n, len(COUPON_CODE_ALPHABET))
+        chars.append(COUPON_CODE_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def _reserve_block(count):
+    """Claim `count` consecutive counter values and return the first one."""
+    with transaction.atomic(savepoint=False):
+        sequence = CouponCodeSequence.objects.filter(pk=1)
+        if not sequence.update(next_value=F('next_value') + count):
+            try:
+                with transaction.atomic():
+                    CouponCodeSequence.objects.create(pk=1, next_value=count)
+                return 0
+            except IntegrityError:
+                # Another worker created the row first.
+                sequence.update(next_value=F('next_value') + count)
+        end = sequence.values_list('next_value', flat=True).get()
+    if end > CODE_SPACE:
+        raise RuntimeError("Coupon code space exhausted.")
+    return end - count
+
+
+def allocate_coupon_codes(count):
+    """Return `count` codes that have never been handed out before.
+
+    Costs one counter update per call regardless of `count`; no per-code
+    lookups against the coupon table are needed.
+    """
+    start = _reserve_block(count)
+    key = _code_key()
+    return [encode_code(permute(n, key)) for n in range(start, start + count)]
+
+
+def parse_expiry_date(value):
+    """The expiry date in a form value, None if it is blank; ValueError if it isn't a date."""
+    if not (value or '').strip():
+        return None
+    expiry_date = parse_date_param(value.strip())
+    if expiry_date is None:
+        raise ValueError("Expiry date must be a valid date (YYYY-MM-DD).")
+    return expiry_date
+
+
+def bulk_create_coupons(owner, quantity, expiry_date=None, prize_type=None, signed=False,
+                        batch_size=COUPON_BATCH_SIZE):
+    """Create `quantity` coupons for `owner` in batches and return how many were created.
+
+    With `signed`, codes are self-verifying (see signedcodes) and numbered by
+    the owner's running total_coupons_created.
+    """
+    if quantity <= 0:
+        return 0
+    if isinstance(expiry_date, str):
+        expiry_date = parse_expiry_date(expiry_date)
+
+    codes = None if signed else allocate_coupon_codes(quantity)
+    with transaction.atomic():
+        ShopOwnerProfile.objects.filter(pk=owner.pk).update(
+            total_coupons_created=F('total_coupons_created') + quantity
+        )
+        # Exact while this transaction holds the profile row.
+        owner.total_coupons_created = ShopOwnerProfile.objects.values_list(
+            'total_coupons_created', flat=True
+        ).get(pk=owner.pk)
+        total = owner.total_coupons_created
+        if signed:
+            codes = [signedcodes.sign(owner.pk, serial, expiry_date) for serial in range(total - quantity, total)]
+
+        for offset in range(0, quantity, batch_size):
+            batch = codes[offset:offset + batch_size]
+            while True:
+                try:
+                    # Allocated codes never repeat, but a legacy random code may
+                    # still occupy one; roll back this batch and draw a fresh block.
+                    # Signed codes can't collide, so they never take this path.
+                    with transaction.atomic():
+                        Coupon.objects.bulk_create(
+                            [
+                                Coupon(code=code, prize_type=prize_type, expiry_date=expiry_date, owner=owner)
+                                for code in batch
+                            ],
+                            batch_size=batch_size,
+                        )
+                    break
+                except IntegrityError:
+                    if signed:
+                        raise
+                    batch = allocate_coupon_codes(len(batch))
+
+        rollups.record_generated(owner.pk, quantity, expiry_date)
+        invalidate_owner_stats(owner.pk)
+        transaction.on_commit(lambda: codefilter.bump_generation(owner.pk))
+    return quantity
+
+
+COUPON_FILTER_PARAMS = ('status', 'prize_type', 'expiry_from', 'expiry_to', 'from', 'to')
+
+
+def filter_coupons(queryset, params):
+    """Narrow a coupon queryset by the status/prize_type/expiry/created filters in `params`."""
+    status = params.get('status')
+    if status in dict(Coupon.STATUS_CHOICES):
+        queryset = queryset.filter(status=status)
+    prize_type = params.get('prize_type', '').strip()
+    if prize_type:
+        queryset = queryset.filter(prize_type=prize_type)
+    for param, lookup in (
+        ('expiry_from', 'expiry_date__gte'),
+        ('expiry_to', 'expiry_date__lte'),
+        ('from', 'created_at__date__gte'),
+        ('to', 'created_at__date__lte'),
+    ):
+        value = parse_date_param(params.get(param))
+        if value:
+            queryset = queryset.filter(**{lookup: value})
+    return queryset
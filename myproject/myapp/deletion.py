@@ -0,0 +1,75 @@
+"""Bulk deletion of an owner's coupons without the ORM delete collector.
+
+`QuerySet.delete()` loads every coupon and every winner pointing at it to
+cascade in Python, all in one transaction. Here each chunk is an id range
+of at most `chunk_size` coupons, deleted with two plain DELETE statements
+(winners first, then coupons) in its own short transaction, so memory use
+and lock hold time stay flat however many coupons the owner has.
+
+The owner's rollups keep their history; each chunk only takes back the
+expiry booked for its unredeemed coupons that haven't lapsed yet.
+"""
+import logging
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import codefilter, rollups
+from .models import Coupon, CustomerWinner
+from .stats import invalidate_owner_stats
+
+logger = logging.getLogger(__name__)
+
+DELETE_CHUNK_SIZE = 5000
+
+
+def _delete_sql():
+    qn = connection.ops.quote_name
+    coupons, winners = qn(Coupon._meta.db_table), qn(CustomerWinner._meta.db_table)
+    coupon_id, owner_id = qn(Coupon._meta.pk.column), qn(Coupon._meta.get_field('owner').column)
+    winner_coupon_id = qn(CustomerWinner._meta.get_field('coupon').column)
+    in_range = f'{owner_id} = %s AND {coupon_id} > %s AND {coupon_id} <= %s'
+    return (
+        f'DELETE FROM {winners} WHERE {winner_coupon_id} IN (SELECT {coupon_id} FROM {coupons} WHERE {in_range})',
+        f'DELETE FROM {coupons} WHERE {in_range}',
+    )
+
+
+def delete_owner_coupons(owner_id, chunk_size=DELETE_CHUNK_SIZE, progress=None):
+    """Delete all of an owner's coupons and their winners; return the number of coupons deleted.
+
+    `progress(deleted, total)` is called after every committed chunk.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1.")
+    remaining = Coupon.objects.filter(owner_id=owner_id)
+    total = remaining.count()
+    delete_winners, delete_coupons = _delete_sql()
+    deleted, last_id = 0, 0
+    while True:
+        upper = list(
+            remaining.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[chunk_size - 1:chunk_size]
+        )
+        # The last chunk is open-ended so coupons added meanwhile go too.
+        high_id = upper[0] if upper else 2 ** 63 - 1
+        with transaction.atomic():
+            pending = (
+                remaining.filter(id__gt=last_id, id__lte=high_id, expiry_date__gte=timezone.localdate())
+                .exclude(status='Used').order_by().values_list('expiry_date').annotate(n=Count('id'))
+            )
+            rollups.record_deleted(owner_id, pending)
+            with connection.cursor() as cursor:
+                cursor.execute(delete_winners, [owner_id, last_id, high_id])
+                cursor.execute(delete_coupons, [owner_id, last_id, high_id])
+                deleted += cursor.rowcount
+        logger.info("Deleted %s/%s coupons of owner %s", deleted, total, owner_id)
+        if progress:
+            progress(deleted, max(total, deleted))
+        if not upper:
+            break
+        last_id = high_id
+
+    invalidate_owner_stats(owner_id)
+    codefilter.discard(owner_id)
+    return deleted
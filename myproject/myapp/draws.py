@@ -0,0 +1,77 @@
+"""Weighted prize draws with Walker's alias method.
+
+Each owner's drawable prizes (weight > 0, stock not exhausted) are turned
+into an alias table once and cached alongside the prize catalogue, under
+the same version; a draw is then one random index and one coin flip,
+whatever the number of prizes. Any prize change, including a redemption
+taking a prize's last unit, bumps that version through
+`catalogue.bump_catalogue_version`. A table read just before a bump can
+still offer a prize that has run out, so the stock decrement in
+`redemption.redeem` is conditional and callers redraw on OUT_OF_STOCK.
+"""
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .catalogue import catalogue_version, is_drawable, prize_catalogue
+
+# Redraws allowed when the cached table offers a prize that has run out.
+DRAW_ATTEMPTS = 3
+
+
+class AliasTable:
+    """O(1) sampling from a fixed discrete distribution.
+
+    Vose's variant of Walker's method.
+    """
+
+    def __init__(self, items, weights):
+        n = len(items)
+        if not n or len(weights) != n:
+            raise ValueError("Need one weight per item and at least one item.")
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError("Weights must add up to more than zero.")
+        self.items = list(items)
+        self.prob = [0.0] * n
+        self.alias = list(range(n))
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s], self.alias[s] = scaled[s], l
+            scaled[l] += scaled[s] - 1
+            (small if scaled[l] < 1 else large).append(l)
+        # Whatever is left is 1 up to rounding error.
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def __len__(self):
+        return len(self.items)
+
+    def sample(self, rng=random):
+        i = rng.randrange(len(self.items))
+        return self.items[i] if rng.random() < self.prob[i] else self.items[self.alias[i]]
+
+
+def prize_table(owner_id):
+    """The owner's cached alias table over prize ids.
+
+    Returns None if nothing can be drawn.
+    """
+    key = f'prize-draw:{owner_id}:{catalogue_version(owner_id)}'
+    table = cache.get(key)
+    if table is None:
+        rows = [(p['id'], p['weight']) for p in prize_catalogue(owner_id) if is_drawable(p)]
+        # An empty list is cached too, so owners without prizes don't
+        # rebuild every spin.
+        table = AliasTable(*zip(*rows)) if rows else []
+        cache.set(key, table, getattr(settings, 'PRIZE_CATALOGUE_CACHE_TIMEOUT', 3600))
+    return table or None
+
+
+def draw_prize_id(owner_id, rng=random):
+    table = prize_table(owner_id)
+    return table.sample(rng) if table else None
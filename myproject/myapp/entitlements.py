@@ -0,0 +1,100 @@
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, DateField, ExpressionWrapper, F, Q, Value, When
+from django.utils import timezone
+
+from .models import UserProfile
+
+PACKAGE_DAYS = 30
+
+
+@dataclass(frozen=True)
+class Entitlement:
+    package_active: bool = False
+    plan_expiration_date: date = None
+
+    @property
+    def is_active(self):
+        # Same rule as UserProfile.is_package_active().
+        return bool(
+            self.package_active
+            and self.plan_expiration_date
+            and self.plan_expiration_date >= date.today()
+        )
+
+
+def _cache_key(user_id):
+    return f'entitlement:{user_id}'
+
+
+def _timeout(entitlement):
+    timeout = getattr(settings, 'ENTITLEMENT_CACHE_TIMEOUT', 3600)
+    if entitlement.is_active:
+        # Expire the entry the moment the plan lapses, at midnight after the
+        # expiration date.
+        lapses = datetime.combine(entitlement.plan_expiration_date + timedelta(days=1), time.min)
+        timeout = min(timeout, max(1, int((lapses - datetime.now()).total_seconds())))
+    return timeout
+
+
+def _load(user_id):
+    row = UserProfile.objects.filter(user_id=user_id).values('package_active', 'plan_expiration_date').first()
+    return Entitlement(**row) if row else Entitlement()
+
+
+def get_entitlement(request):
+    """Plan entitlement for `request.user`, memoised on the request and cached per user."""
+    if not hasattr(request, '_entitlement'):
+        key = _cache_key(request.user.pk)
+        entitlement = cache.get(key)
+        if entitlement is None:
+            entitlement = _load(request.user.pk)
+            cache.set(key, entitlement, _timeout(entitlement))
+        request._entitlement = entitlement
+    return request._entitlement
+
+
+def invalidate_entitlement(user_id):
+    key = _cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def confirm_payments(queryset):
+    """Confirm unconfirmed payments and activate/extend each payer's package.
+
+    Each confirmed payment adds PACKAGE_DAYS, starting from today when the
+    plan has lapsed or was never set. Uses one UPDATE for the payments and
+    one per distinct payment count for the profiles.
+    """
+    today = timezone.now().date()
+    with transaction.atomic():
+        pending = queryset.filter(is_confirmed=False)
+        payments_per_user = dict(
+            pending.order_by().values('user_id').annotate(n=Count('id')).values_list('user_id', 'n')
+        )
+        confirmed = pending.update(is_confirmed=True, confirmed_at=timezone.now())
+
+        users_by_count = {}
+        for user_id, n in payments_per_user.items():
+            users_by_count.setdefault(n, []).append(user_id)
+        for n, user_ids in users_by_count.items():
+            days = timedelta(days=PACKAGE_DAYS * n)
+            UserProfile.objects.filter(user_id__in=user_ids).update(
+                package_active=True,
+                plan_expiration_date=Case(
+                    When(
+                        Q(plan_expiration_date__isnull=True) | Q(plan_expiration_date__lt=today),
+                        then=Value(today + days),
+                    ),
+                    default=ExpressionWrapper(F('plan_expiration_date') + days, output_field=DateField()),
+                    output_field=DateField(),
+                ),
+            )
+        for user_id in payments_per_user:
+            invalidate_entitlement(user_id)
+    return confirmed
@@ -0,0 +1,77 @@
+import csv
+import zlib
+
+from django.http import StreamingHttpResponse
+
+EXPORT_CHUNK_SIZE = 2000
+
+COUPON_EXPORT_FIELDS = ('code', 'prize_type', 'expiry_date', 'status', 'created_at')
+COUPON_EXPORT_HEADER = ['Code', 'Prize', 'Expiry Date', 'Status', 'Created At']
+
+WINNER_EXPORT_FIELDS = ('customer_name', 'mobile_number', 'coupon__code', 'prize__name', 'redeemed_at')
+WINNER_EXPORT_HEADER = ['Customer Name', 'Mobile Number', 'Coupon Code', 'Prize', 'Redeemed At']
+
+
+class _Echo:
+    """File-like object whose write() hands the line straight back to csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _gzip(lines, flush_every=64 * 1024):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    pending = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending += len(data)
+        chunk = compressor.compress(data)
+        if pending >= flush_every:
+            chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def stream_csv(filename, header, rows, compress=False):
+    """Return a StreamingHttpResponse that writes `rows` as CSV one line at a time.
+
+    `rows` should be a lazy iterable (e.g. `values_list(...).iterator()`) so
+    memory stays flat regardless of the number of rows.
+    """
+    lines = _csv_lines(header, rows)
+    if compress:
+        response = StreamingHttpResponse(_gzip(lines), content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(lines, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def write_csv(fileobj, header, rows, compress=False):
+    """Write `rows` as CSV to a binary file, gzipped with `compress`; return the row count."""
+    count = 0
+
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    lines = _csv_lines(header, counted(rows))
+    if compress:
+        for chunk in _gzip(lines):
+            fileobj.write(chunk)
+    else:
+        for line in lines:
+            fileobj.write(line.encode('utf-8'))
+    return count
@@ -0,0 +1,127 @@
+"""Resized WebP/JPEG derivatives of prize images for `srcset`.
+
+Each derivative is saved under a requested name of the form
+`<dir>/derived/<stem>-<prize>-<width>.<fmt>`, and the name the storage
+returns is recorded in `Prize.image_derivatives`, so templates never have
+to ask the storage whether a file exists. With the default
+ContentAddressedStorage the requested name is ignored and the file lands
+in `blobs/<digest>`, shared and reference-counted like any other upload.
+Generation runs on a small thread pool after the saving transaction
+commits, keeping Pillow off the request thread.
+"""
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .catalogue import bump_catalogue_version
+from .models import Prize
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = (160, 320, 640)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='prize-images')
+
+
+def derivative_name(name, prize_id, width, fmt):
+    """Name to request for a derivative; the storage may choose another."""
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'derived', f'{stem}-{prize_id}-{width}.{fmt}')
+
+
+def render_derivatives(name, prize_id, storage=default_storage):
+    """Write every derivative of `prize_id`'s image at `name` and return their names.
+
+    Files are never overwritten: if a name is taken the storage picks a free
+    one, so two renders can't clobber or later delete each other's output.
+    """
+    with storage.open(name, 'rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'P') else 'RGB')
+
+    derivatives = {fmt: {} for fmt in FORMATS}
+    # Never upscale: widths above the original collapse to the original width.
+    widths = sorted({min(width, image.width) for width in DERIVATIVE_WIDTHS})
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        for fmt, (pil_format, options) in FORMATS.items():
+            frame = resized.convert('RGB') if pil_format == 'JPEG' else resized
+            buffer = io.BytesIO()
+            frame.save(buffer, pil_format, **options)
+            target = derivative_name(name, prize_id, width, fmt)
+            derivatives[fmt][str(width)] = storage.save(target, ContentFile(buffer.getvalue()))
+    return derivatives
+
+
+def delete_derivatives(derivatives, storage=default_storage):
+    for names in derivatives.values():
+        for name in names.values():
+            storage.delete(name)
+
+
+def build_derivatives(prize_id):
+    """Generate and record derivatives for one prize's current image, releasing any it replaces.
+
+    Returns the new derivatives, or None if the prize has no image or it was
+    replaced while they were rendered; they are then released again.
+    """
+    prize = Prize.objects.filter(pk=prize_id).values('image', 'owner_id').first()
+    if not prize or not prize['image']:
+        return None
+    derivatives = render_derivatives(prize['image'], prize_id)
+    with transaction.atomic():
+        current = (
+            Prize.objects.select_for_update().filter(pk=prize_id, image=prize['image'])
+            .values_list('image_derivatives', flat=True).first()
+        )
+        if current is None:
+            stale, derivatives = derivatives, None
+        else:
+            stale = current
+            Prize.objects.filter(pk=prize_id).update(image_derivatives=derivatives)
+            bump_catalogue_version(prize['owner_id'])
+        if stale:
+            transaction.on_commit(lambda: delete_derivatives(stale))
+    return derivatives
+
+
+def _build_in_background(prize_id):
+    close_old_connections()
+    try:
+        build_derivatives(prize_id)
+    except Exception:
+        logger.exception("Failed to build image derivatives for prize %s", prize_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_derivatives(prize):
+    """Queue derivative generation for `prize` once the current transaction commits."""
+    if not prize.image:
+        return
+    if prize.image_derivatives:
+        old = prize.image_derivatives
+        Prize.objects.filter(pk=prize.pk).update(image_derivatives={})
+        prize.image_derivatives = {}
+        bump_catalogue_version(prize.owner_id)
+        # Only once the row stops pointing at them; a rollback keeps them in use.
+        transaction.on_commit(lambda: delete_derivatives(old))
+    if getattr(settings, 'PRIZE_IMAGES_ASYNC', True):
+        transaction.on_commit(lambda: _executor.submit(_build_in_background, prize.pk))
+    else:
+        transaction.on_commit(lambda: build_derivatives(prize.pk))
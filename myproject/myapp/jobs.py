@@ -0,0 +1,175 @@
+"""Background jobs for long owner operations, stored in the database.
+
+Views `enqueue()` a Job row and return at once; `manage.py run_jobs` claims
+queued jobs and runs them in a process pool. Claiming is a conditional
+UPDATE on `status='queued'`, so two workers never run the same job, and no
+broker is needed. Handlers report progress into the row, which the
+`job_status` endpoint returns for polling.
+"""
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import IntegerField, Sum
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast
+from django.urls import reverse
+from django.utils import timezone
+
+from .coupons import bulk_create_coupons, filter_coupons
+from .deletion import delete_owner_coupons
+from .exports import COUPON_EXPORT_FIELDS, COUPON_EXPORT_HEADER, EXPORT_CHUNK_SIZE, write_csv
+from .models import Coupon, Job
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+GENERATE = 'generate_coupons'
+EXPORT = 'export_coupons'
+DELETE = 'delete_coupons'
+
+# Coupons created per transaction by a generation job.
+GENERATE_CHUNK_SIZE = 5000
+# Rows between progress updates of an export job.
+EXPORT_PROGRESS_EVERY = 10000
+
+
+def export_dir():
+    return getattr(settings, 'JOB_EXPORT_DIR', os.path.join(settings.BASE_DIR, 'exports'))
+
+
+def export_path(job):
+    return os.path.join(export_dir(), f'coupons-{job.pk}.csv.gz')
+
+
+def _generate(job, progress):
+    params = job.params
+    quantity = params['quantity']
+    # Each chunk commits together with its progress, so a requeued job
+    # resumes where it stopped instead of creating coupons twice.
+    done = job.progress_done
+    while done < quantity:
+        n = min(GENERATE_CHUNK_SIZE, quantity - done)
+        with transaction.atomic():
+            bulk_create_coupons(
+                job.owner, n,
+                expiry_date=params.get('expiry_date'),
+                prize_type=params.get('prize_type'),
+                signed=params.get('signed', False),
+            )
+            done += n
+            progress(done, quantity)
+    return {'created': done}
+
+
+def _export(job, progress):
+    coupons = filter_coupons(Coupon.objects.filter(owner_id=job.owner_id), job.params)
+    total = coupons.count()
+
+    def rows():
+        for i, row in enumerate(coupons.order_by('id').values_list(*COUPON_EXPORT_FIELDS).iterator(
+            chunk_size=EXPORT_CHUNK_SIZE
+        ), 1):
+            if i % EXPORT_PROGRESS_EVERY == 0:
+                progress(i, max(total, i))
+            yield row
+
+    os.makedirs(export_dir(), exist_ok=True)
+    path = export_path(job)
+    with open(path + '.part', 'wb') as f:
+        count = write_csv(f, COUPON_EXPORT_HEADER, rows(), compress=True)
+    os.replace(path + '.part', path)
+    progress(count, count)
+    return {'rows': count}
+
+
+def _delete(job, progress):
+    return {'deleted': delete_owner_coupons(job.owner_id, progress=progress)}
+
+
+HANDLERS = {
+    GENERATE: _generate,
+    EXPORT: _export,
+    DELETE: _delete,
+}
+
+
+def enqueue(owner, kind, **params):
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    return Job.objects.create(owner=owner, kind=kind, params=params)
+
+
+def pending_generation(owner):
+    """Coupons queued or being generated for `owner` but not created yet."""
+    pending = Job.objects.filter(owner=owner, kind=GENERATE, status__in=(QUEUED, RUNNING)).aggregate(
+        quantity=Sum(Cast(KT('params__quantity'), IntegerField())),
+        done=Sum('progress_done'),
+    )
+    return (pending['quantity'] or 0) - (pending['done'] or 0)
+
+
+def claim_next():
+    """Mark the oldest queued job as running and return it, or None if there is none."""
+    while True:
+        job_id = Job.objects.filter(status=QUEUED).order_by('id').values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        if Job.objects.filter(pk=job_id, status=QUEUED).update(status=RUNNING, updated_at=timezone.now()):
+            return Job.objects.get(pk=job_id)
+        # Another worker claimed it first; try the next one.
+
+
+def requeue_stale(older_than):
+    """Put running jobs that haven't reported for `older_than` seconds back in the queue."""
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    return Job.objects.filter(status=RUNNING, updated_at__lt=cutoff).update(status=QUEUED, updated_at=timezone.now())
+
+
+def run_job(job_id):
+    """Run a claimed job to completion, recording its result or error."""
+    job = Job.objects.select_related('owner').get(pk=job_id)
+    jobs = Job.objects.filter(pk=job_id)
+
+    def progress(done, total):
+        jobs.update(progress_done=done, progress_total=total, updated_at=timezone.now())
+
+    try:
+        result = HANDLERS[job.kind](job, progress)
+    except Exception as exc:
+        logger.exception("Job %s (%s) failed", job_id, job.kind)
+        jobs.update(status=FAILED, error=str(exc), finished_at=timezone.now(), updated_at=timezone.now())
+        return FAILED
+    jobs.update(status=DONE, result=result, finished_at=timezone.now(), updated_at=timezone.now())
+    return DONE
+
+
+def run_pending():
+    """Run every queued job in this process; returns how many ran."""
+    count = 0
+    while (job := claim_next()) is not None:
+        run_job(job.pk)
+        count += 1
+    return count
+
+
+def job_status(job):
+    status = {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'done': job.progress_done,
+        'total': job.progress_total,
+        'percent': round(100 * job.progress_done / job.progress_total) if job.progress_total else 0,
+        'result': job.result,
+        'error': job.error,
+    }
+    if job.kind == EXPORT and job.status == DONE:
+        status['download_url'] = reverse('job_download', args=[job.pk])
+    return status
@@ -0,0 +1,56 @@
+from django.core.paginator import Paginator
+from django.db.models import Max, Min
+from django.utils.dateparse import parse_date
+from django.utils.functional import cached_property
+
+PAGE_SIZE = 50
+
+
+def parse_date_param(value):
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
+def parse_cursor(value):
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor > 0 else None
+
+
+def keyset_page(queryset, before=None, size=PAGE_SIZE):
+    """Return `(rows, next_cursor)` for a newest-first page of `queryset`.
+
+    Pages are addressed by the last id seen rather than by an offset, so the
+    cost of a page does not depend on how deep into the list it is.
+    """
+    if before:
+        queryset = queryset.filter(id__lt=before)
+    rows = list(queryset.order_by('-id')[:size + 1])
+    if len(rows) > size:
+        rows = rows[:size]
+        return rows, rows[-1].id
+    return rows, None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that estimates the length of large unfiltered querysets.
+
+    An exact COUNT(*) reads the whole table. Unfiltered, the spread of the
+    primary keys is read from the two ends of the index instead; it only
+    overstates by the rows deleted since. Filtered querysets and tables
+    smaller than `estimate_above` are counted exactly.
+    """
+    estimate_above = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            bounds = self.object_list.order_by().aggregate(low=Min('pk'), high=Max('pk'))
+            if bounds['high'] is not None and bounds['high'] - bounds['low'] + 1 > self.estimate_above:
+                return bounds['high'] - bounds['low'] + 1
+        return super().count
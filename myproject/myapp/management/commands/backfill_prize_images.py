@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from myapp.images import build_derivatives
+from myapp.models import Prize
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG derivatives for prizes that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild derivatives that already exist.")
+
+    def handle(self, *args, **options):
+        prizes = Prize.objects.exclude(image='').order_by('pk')
+        if not options['force']:
+            prizes = prizes.filter(image_derivatives={})
+        built = failed = 0
+        for prize in prizes.only('pk', 'image').iterator():
+            try:
+                # Releases the derivatives it replaces.
+                build_derivatives(prize.pk)
+            except (OSError, ValueError) as exc:
+                failed += 1
+                self.stderr.write(f"Prize {prize.pk} ({prize.image.name}): {exc}")
+                continue
+            built += 1
+        self.stdout.write(self.style.SUCCESS(f"Built derivatives for {built} prize(s); {failed} failed."))
@@ -0,0 +1,157 @@
+import http.client
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from myapp.coupons import bulk_create_coupons
+from myapp.models import Coupon, Prize, ShopOwnerProfile
+
+BENCH_USERNAME = '__bench_asgi__'
+
+SERVERS = {
+    'wsgi': (
+        ['gunicorn', 'myproject.wsgi:application', '--workers', '{workers}', '--bind', '127.0.0.1:{port}', '--log-level', 'warning'],
+        '/validate_coupon/',
+        '/redeem_coupon/',
+    ),
+    'asgi': (
+        ['uvicorn', 'myproject.asgi:application', '--workers', '{workers}', '--port', '{port}', '--log-level', 'warning'],
+        '/async/validate_coupon/',
+        '/async/redeem_coupon/',
+    ),
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start.")
+
+
+def _run_load(port, requests, concurrency):
+    """Fire `requests` (method, path, body, headers) from `concurrency` threads; return latencies."""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    queue = iter(requests)
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        while True:
+            with lock:
+                item = next(queue, None)
+            if item is None:
+                break
+            method, path, body, headers = item
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+        conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, len(errors), time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/sec and p99 latency of the validate/redeem endpoints under "
+        "gunicorn (WSGI, sync views) and uvicorn (ASGI, async views) at equal worker counts. "
+        "Creates a throwaway shop owner in the configured database and removes it afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=32)
+
+    def _login_session(self, user):
+        store = import_module(settings.SESSION_ENGINE).SessionStore()
+        store[SESSION_KEY] = str(user.pk)
+        store[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        store.save()
+        return store
+
+    def handle(self, *args, **options):
+        User.objects.filter(username=BENCH_USERNAME).delete()
+        user = User.objects.create_user(username=BENCH_USERNAME)
+        owner = ShopOwnerProfile.objects.create(user=user)
+        prize = Prize.objects.create(name='Bench', owner=owner)
+        session = self._login_session(user)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+        n = options['requests']
+        try:
+            self.stdout.write(f"{'server':<6} {'endpoint':<9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+            for name, (command, validate_path, redeem_path) in SERVERS.items():
+                bulk_create_coupons(owner, n)
+                codes = list(Coupon.objects.filter(owner=owner, status='Active').values_list('code', flat=True)[:n])
+                port = _free_port()
+                argv = [part.format(workers=options['workers'], port=port) for part in command]
+                server = subprocess.Popen(argv, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=sys.stderr)
+                try:
+                    _wait_for(port)
+                    validate = [
+                        ('GET', f'{validate_path}?coupon={code}', None, {'Cookie': cookie})
+                        for code in codes
+                    ]
+                    redeem = [
+                        (
+                            'POST',
+                            redeem_path,
+                            urllib.parse.urlencode({
+                                'coupon': code, 'name': 'Bench', 'contact': '0',
+                                'prize_id': prize.pk, 'owner_id': owner.pk,
+                            }),
+                            {'Content-Type': 'application/x-www-form-urlencoded'},
+                        )
+                        for code in codes
+                    ]
+                    for endpoint, requests in (('validate', validate), ('redeem', redeem)):
+                        latencies, errors, wall = _run_load(port, requests, options['concurrency'])
+                        latencies.sort()
+                        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+                        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+                        self.stdout.write(
+                            f"{name:<6} {endpoint:<9} {len(latencies) / wall:>9.0f} {p50:>8.1f} {p99:>8.1f} {errors:>7}"
+                        )
+                finally:
+                    server.terminate()
+                    server.wait()
+                Coupon.objects.filter(owner=owner).delete()
+        finally:
+            session.delete()
+            user.delete()
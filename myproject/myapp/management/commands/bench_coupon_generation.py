@@ -0,0 +1,38 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from myapp.coupons import bulk_create_coupons
+from myapp.models import ShopOwnerProfile
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Measure wall time and query count of bulk coupon generation. Nothing is persisted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('quantities', nargs='*', type=int, default=[10, 100, 1000, 10000, 100000])
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'quantity':>10} {'seconds':>10} {'queries':>10} {'codes/s':>12}")
+        for quantity in options['quantities']:
+            try:
+                with transaction.atomic():
+                    user = User.objects.create_user(username='__bench_coupon_generation__')
+                    owner = ShopOwnerProfile.objects.create(user=user)
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        bulk_create_coupons(owner, quantity, prize_type='bench')
+                        elapsed = time.perf_counter() - started
+                    raise _Rollback
+            except _Rollback:
+                pass
+            self.stdout.write(
+                f"{quantity:>10} {elapsed:>10.3f} {len(queries):>10} {quantity / elapsed:>12.0f}"
+            )
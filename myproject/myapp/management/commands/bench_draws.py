@@ -0,0 +1,63 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp.catalogue import bump_catalogue_version
+from myapp.draws import draw_prize_id, prize_table
+from myapp.models import Prize, ShopOwnerProfile
+
+
+def _per_second(fn, seconds):
+    fn()
+    count, started = 0, time.perf_counter()
+    while (elapsed := time.perf_counter() - started) < seconds:
+        for _ in range(100):
+            fn()
+        count += 100
+    return count / elapsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Draws per second: reloading the prize list every spin (uniform and weighted) "
+        "against the cached alias table. Uses the configured cache and a throwaway owner "
+        "that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prizes', type=int, default=50)
+        parser.add_argument('--seconds', type=float, default=2.0, help="Time spent on each method.")
+
+    def handle(self, *args, **options):
+        seconds = options['seconds']
+        rng = random.Random(0)
+        with transaction.atomic():
+            owner = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='__bench_draws__'))
+            Prize.objects.bulk_create(
+                Prize(owner=owner, name=f'Prize {i}', weight=rng.randint(1, 500), stock=rng.choice([None, 10 ** 6]))
+                for i in range(options['prizes'])
+            )
+            bump_catalogue_version(owner.pk)
+
+            def reload_uniform():
+                random.choice(list(Prize.objects.filter(owner=owner)))
+
+            def reload_weighted():
+                prizes = list(Prize.objects.filter(owner=owner))
+                random.choices(prizes, weights=[p.weight for p in prizes])
+
+            table = prize_table(owner.pk)
+            rows = [
+                ("reload + random.choice", reload_uniform),
+                ("reload + random.choices", reload_weighted),
+                ("cached alias table", lambda: draw_prize_id(owner.pk)),
+                ("alias sample only", table.sample),
+            ]
+            self.stdout.write(f"{'method':<26} {'draws/s':>12}")
+            for label, fn in rows:
+                self.stdout.write(f"{label:<26} {_per_second(fn, seconds):>12,.0f}")
+            transaction.set_rollback(True)
+        bump_catalogue_version(owner.pk)
@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+PROFILES = {
+    # What DATABASES looked like before: rollback journal, deferred
+    # transactions and a fresh connection per request.
+    'default': {'CONN_MAX_AGE': 0, 'OPTIONS': {}, 'PRAGMAS': {'journal_mode': 'delete'}},
+    'tuned': {
+        'CONN_MAX_AGE': settings.DATABASES['default'].get('CONN_MAX_AGE', 0),
+        'OPTIONS': settings.DATABASES['default'].get('OPTIONS', {}),
+        'PRAGMAS': getattr(settings, 'SQLITE_PRAGMAS', {}),
+    },
+}
+
+
+def _use_database(path, profile):
+    connection.close()
+    connection.settings_dict.update(NAME=path, CONN_MAX_AGE=profile['CONN_MAX_AGE'], OPTIONS=profile['OPTIONS'])
+    settings.SQLITE_PRAGMAS = profile['PRAGMAS']
+
+
+def _worker(path, profile_name, owner_id, prize_id, codes, start, results):
+    import django
+    django.setup()
+    from myapp.models import Coupon, Prize
+    from myapp.redemption import redeem
+
+    profile = PROFILES[profile_name]
+    _use_database(path, profile)
+    prize = Prize.objects.get(pk=prize_id)
+    ok = locked = 0
+    latencies = []
+    start.wait()
+    for code in codes:
+        started = time.perf_counter()
+        try:
+            # A spin: look the coupon up, then redeem it.
+            Coupon.objects.filter(owner_id=owner_id, code=code).values('status').first()
+            redeem(owner_id, code, prize, 'Bench', '0')
+            ok += 1
+        except OperationalError:
+            locked += 1
+        latencies.append(time.perf_counter() - started)
+        if not profile['CONN_MAX_AGE']:
+            # End of request: the connection isn't kept.
+            connection.close()
+    connection.close()
+    results.put((ok, locked, latencies))
+
+
+class Command(BaseCommand):
+    help = (
+        "Multi-process redemption load test on a scratch copy of the schema, comparing "
+        "the previous SQLite defaults with the tuned profile from settings. Reports "
+        "throughput, p99 latency and the share of 'database is locked' errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--spins', type=int, default=300, help="Redemptions per process.")
+
+    def handle(self, *args, **options):
+        # Imported here, not at module level: spawned workers import this
+        # module before django.setup().
+        from django.contrib.auth.models import User
+
+        from myapp.coupons import bulk_create_coupons
+        from myapp.models import Coupon, Prize, ShopOwnerProfile
+
+        processes, spins = options['processes'], options['spins']
+        scratch = tempfile.mkdtemp()
+        context = multiprocessing.get_context('spawn')
+        self.stdout.write(f"{'profile':<8} {'spins/s':>9} {'p99 ms':>8} {'locked':>8}")
+        try:
+            for name, profile in PROFILES.items():
+                path = os.path.join(scratch, f'{name}.sqlite3')
+                _use_database(path, profile)
+                call_command('migrate', verbosity=0)
+                owner = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='bench'))
+                prize = Prize.objects.create(name='Bench', owner=owner)
+                bulk_create_coupons(owner, processes * spins)
+                codes = list(Coupon.objects.filter(owner=owner).values_list('code', flat=True))
+                connection.close()
+
+                # Workers and this process all wait here, so timing starts
+                # once every worker has finished django.setup().
+                start = context.Barrier(processes + 1)
+                results = context.Queue()
+                workers = [
+                    context.Process(
+                        target=_worker,
+                        args=(path, name, owner.pk, prize.pk, codes[i::processes], start, results),
+                    )
+                    for i in range(processes)
+                ]
+                for worker in workers:
+                    worker.start()
+                start.wait()
+                started = time.perf_counter()
+                outcomes = [results.get(timeout=600) for _ in workers]
+                wall = time.perf_counter() - started
+                for worker in workers:
+                    worker.join()
+
+                ok = sum(o[0] for o in outcomes)
+                locked = sum(o[1] for o in outcomes)
+                latencies = sorted(latency for o in outcomes for latency in o[2])
+                p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+                self.stdout.write(
+                    f"{name:<8} {ok / wall:>9.0f} {p99:>8.1f} {locked / (ok + locked):>8.1%}"
+                )
+        finally:
+            connection.close()
+            shutil.rmtree(scratch, ignore_errors=True)
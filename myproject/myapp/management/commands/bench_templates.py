@@ -0,0 +1,80 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.backends.django import DjangoTemplates
+from django.test import Client, RequestFactory
+from django.test.utils import override_settings
+
+PUBLIC_PAGES = ('/', '/about/', '/services/')
+SOURCE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+def _per_call(fn, iterations):
+    fn()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+def _backend(cached):
+    options = dict(settings.TEMPLATES[0]['OPTIONS'])
+    options['loaders'] = [('django.template.loaders.cached.Loader', SOURCE_LOADERS)] if cached else SOURCE_LOADERS
+    return DjangoTemplates({'NAME': f'bench-{cached}', 'DIRS': [], 'APP_DIRS': False, 'OPTIONS': options})
+
+
+class Command(BaseCommand):
+    help = (
+        "Time template rendering with and without the cached loader, anonymous requests "
+        "for the public pages with and without the page cache, and the dashboard layout "
+        "with cold and warm fragment caches. Uses the configured cache; the throwaway "
+        "user is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def row(self, label, before, after):
+        self.stdout.write(f"{label:<28} {before:>9.3f} {after:>9.3f} {before / after:>7.1f}x")
+
+    def handle(self, *args, **options):
+        n = options['iterations']
+        factory = RequestFactory()
+        self.stdout.write(f"{'ms per render':<28} {'before':>9} {'after':>9} {'speedup':>8}")
+
+        uncached, cached = _backend(False), _backend(True)
+        for name in ('index.html', 'about.html', 'services.html'):
+            request = factory.get('/')
+            request.user = AnonymousUser()
+            self.row(
+                f"loader: {name}",
+                _per_call(lambda: uncached.get_template(name).render({}, request), n),
+                _per_call(lambda: cached.get_template(name).render({}, request), n),
+            )
+
+        with override_settings(ALLOWED_HOSTS=['*']):
+            client = Client()
+            for path in PUBLIC_PAGES:
+                def miss():
+                    cache.clear()
+                    client.get(path)
+                self.row(f"page cache: {path}", _per_call(miss, n), _per_call(lambda: client.get(path), n))
+
+        with transaction.atomic():
+            request = factory.get('/dash/')
+            request.user = User.objects.create_user(username='__bench_templates__')
+            layout = cached.from_string("{% extends 'base1.html' %}")
+
+            def cold():
+                cache.clear()
+                layout.render({}, request)
+            self.row("fragments: base1.html", _per_call(cold, n), _per_call(lambda: layout.render({}, request), n))
+            transaction.set_rollback(True)
+        cache.clear()
@@ -0,0 +1,100 @@
+import hashlib
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from myapp.catalogue import bump_catalogue_version
+from myapp.models import Prize, ShopOwnerProfile, StoredBlob
+from myapp.storage import BLOB_DIR, ContentAddressedStorage
+
+
+def _size(name):
+    try:
+        return default_storage.size(name)
+    except OSError:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Move existing prize and profile images into content-addressed storage, "
+        "collapsing byte-identical copies into one blob, remove blob files no row counts, "
+        "and report the space reclaimed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be reclaimed.")
+
+    def _references(self):
+        """(model, pk, field, name) for every media name the database points at."""
+        for model in (Prize, ShopOwnerProfile):
+            for pk, name in model.objects.exclude(image='').exclude(image=None).values_list('pk', 'image'):
+                yield model, pk, 'image', name
+        for pk, derivatives in Prize.objects.exclude(image_derivatives={}).values_list('pk', 'image_derivatives'):
+            for fmt, names in derivatives.items():
+                for width, name in names.items():
+                    yield Prize, pk, (fmt, width), name
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("The default storage is not ContentAddressedStorage.")
+
+        legacy = [ref for ref in self._references() if not ref[3].startswith(BLOB_DIR + '/')]
+        missing = [ref for ref in legacy if _size(ref[3]) is None]
+        for model, pk, field, name in missing:
+            self.stderr.write(f"{model.__name__} {pk}: {name} is missing, left as is.")
+        legacy = [ref for ref in legacy if ref not in missing]
+        legacy_bytes = sum(_size(name) for name in {ref[3] for ref in legacy})
+        blobs_before = set(StoredBlob.objects.values_list('name', flat=True))
+        # Left behind by saves whose transaction rolled back.
+        orphans = list(default_storage.orphans())
+        orphan_bytes = sum(_size(name) or 0 for name in orphans)
+
+        if options['dry_run']:
+            digests = {}
+            for name in {ref[3] for ref in legacy}:
+                with default_storage.open(name) as f:
+                    digest = hashlib.sha256()
+                    for chunk in f.chunks():
+                        digest.update(chunk)
+                digests.setdefault(digest.hexdigest(), _size(name))
+            after = sum(digests.values())
+            self.stdout.write(
+                f"{len({ref[3] for ref in legacy})} file(s), {legacy_bytes} bytes -> "
+                f"{len(digests)} blob(s), {after} bytes; would reclaim up to {legacy_bytes - after} bytes."
+            )
+            self.stdout.write(f"Would remove {len(orphans)} orphaned blob(s), {orphan_bytes} bytes.")
+            return
+
+        renamed = {}
+        for model, pk, field, name in legacy:
+            # One save per reference, so each row holds its own reference count.
+            with default_storage.open(name) as f:
+                stored = default_storage.save(name, f)
+            renamed[name] = stored
+            with transaction.atomic():
+                if field == 'image':
+                    model.objects.filter(pk=pk).update(image=stored)
+                else:
+                    prize = Prize.objects.select_for_update().get(pk=pk)
+                    fmt, width = field
+                    prize.image_derivatives[fmt][width] = stored
+                    Prize.objects.filter(pk=pk).update(image_derivatives=prize.image_derivatives)
+
+        for name in renamed:
+            default_storage.delete(name)
+        # Cached prize catalogues hold the old URLs.
+        prize_ids = {pk for model, pk, field, name in legacy if model is Prize}
+        for owner_id in set(Prize.objects.filter(pk__in=prize_ids).values_list('owner_id', flat=True)):
+            bump_catalogue_version(owner_id)
+
+        new_blobs = StoredBlob.objects.filter(name__in=set(renamed.values())).exclude(name__in=blobs_before)
+        blob_bytes = sum(new_blobs.values_list('size', flat=True))
+        self.stdout.write(self.style.SUCCESS(
+            f"Migrated {len(renamed)} file(s), {legacy_bytes} bytes, into {new_blobs.count()} new blob(s), "
+            f"{blob_bytes} bytes; reclaimed {legacy_bytes - blob_bytes} bytes."
+        ))
+        for name in orphans:
+            default_storage.delete_orphan(name)
+        self.stdout.write(self.style.SUCCESS(f"Removed {len(orphans)} orphaned blob(s), {orphan_bytes} bytes."))
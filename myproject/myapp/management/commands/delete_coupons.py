@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.deletion import DELETE_CHUNK_SIZE, delete_owner_coupons
+from myapp.models import ShopOwnerProfile
+
+
+class Command(BaseCommand):
+    help = "Delete every coupon (and its winners) of one shop owner in small chunks, printing progress."
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_id', type=int)
+        parser.add_argument('--chunk-size', type=int, default=DELETE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        owner_id = ShopOwnerProfile.objects.filter(user_id=options['user_id']).values_list('pk', flat=True).first()
+        if owner_id is None:
+            raise CommandError(f"No shop owner for user {options['user_id']}.")
+
+        def progress(deleted, total):
+            self.stdout.write(f"\r{deleted}/{total} coupons deleted", ending='')
+            self.stdout.flush()
+
+        deleted = delete_owner_coupons(owner_id, options['chunk_size'], progress)
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} coupons."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from myapp.models import ShopOwnerProfile
+from myapp.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill or rebuild the daily rollups from the coupon and winner tables, "
+        "one owner per transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int, help="Only these owners' users (default: every owner).")
+
+    def handle(self, *args, **options):
+        owners = ShopOwnerProfile.objects.order_by('pk')
+        if options['user_ids']:
+            owners = owners.filter(user_id__in=options['user_ids'])
+        count = rows = 0
+        for owner_id in list(owners.values_list('pk', flat=True)):
+            rows += rebuild(owner_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup row(s) for {count} owner(s)."))
@@ -0,0 +1,66 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+
+from myapp import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (coupon generation, exports, mass deletes) in a pool "
+        "of worker processes, polling the job table for new work."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help="Pool size; 0 runs jobs in this process.")
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds between polls when idle.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+        parser.add_argument(
+            '--stale-after', type=int, default=600,
+            help="Requeue running jobs that haven't reported progress for this many seconds.",
+        )
+
+    def handle(self, *args, **options):
+        requeued = jobs.requeue_stale(options['stale_after'])
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s).")
+        if options['processes'] <= 0:
+            self._run_inline(options)
+        else:
+            self._run_pool(options)
+
+    def _run_inline(self, options):
+        while True:
+            job = jobs.claim_next()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+                continue
+            self._report(job.pk, jobs.run_job(job.pk))
+
+    def _run_pool(self, options):
+        size = options['processes']
+        # Workers are spawned, not forked, so none inherits this process's
+        # database connection; each sets Django up before taking work.
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=size, mp_context=context, initializer=django.setup) as pool:
+            running = {}
+            while True:
+                while len(running) < size and (job := jobs.claim_next()) is not None:
+                    running[pool.submit(jobs.run_job, job.pk)] = job.pk
+                if not running:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll'])
+                    continue
+                finished, _ = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                for future in finished:
+                    self._report(running.pop(future), future.result())
+
+    def _report(self, job_id, status):
+        style = self.style.SUCCESS if status == jobs.DONE else self.style.ERROR
+        self.stdout.write(style(f"Job {job_id}: {status}"))
@@ -83,6 +83,16 @@ class Migration(migrations.Migration):
             name='owner',
             field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coupons', to='myapp.shopownerprofile'),
         ),
+        migrations.AddField(
+            model_name='customerwinner',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='winners', to='myapp.shopownerprofile'),
+        ),
+        migrations.AddField(
+            model_name='prize',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prizes', to='myapp.shopownerprofile'),
+        ),
         migrations.CreateModel(
             name='UserProfile',
             fields=[
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_coupon_code_sequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['owner', '-id'], name='coupon_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['owner', 'status'], name='coupon_owner_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(condition=models.Q(('status', 'Active')), fields=['owner', 'expiry_date'], name='coupon_owner_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerwinner',
+            index=models.Index(fields=['owner', '-redeemed_at'], name='winner_owner_redeemed_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_owner_scoped_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prize',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_stored_blob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # auth_user belongs to django.contrib.auth, so its indexes can't be
+    # declared on the model; these back myapp.backends.users_matching().
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX auth_user_email_upper_idx ON auth_user (UPPER(email))',
+            'DROP INDEX auth_user_email_upper_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX auth_user_username_upper_idx ON auth_user (UPPER(username))',
+            'DROP INDEX auth_user_username_upper_idx',
+        ),
+    ]
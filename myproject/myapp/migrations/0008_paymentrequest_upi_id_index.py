@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentrequest',
+            name='upi_id',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
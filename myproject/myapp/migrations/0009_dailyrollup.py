@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_paymentrequest_upi_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('prize_key', models.PositiveIntegerField(default=0)),
+                ('generated', models.IntegerField(default=0)),
+                ('redeemed', models.IntegerField(default=0)),
+                ('expired', models.IntegerField(default=0)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='myapp.shopownerprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('owner', 'day', 'prize_key'), name='rollup_owner_day_prize_uniq')],
+            },
+        ),
+    ]
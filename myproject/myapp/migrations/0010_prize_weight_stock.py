@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_dailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prize',
+            name='stock',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prize',
+            name='weight',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
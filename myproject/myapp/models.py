@@ -19,6 +19,11 @@ class Prize(models.Model):
     name = models.CharField(max_length=255)
     image = models.ImageField(upload_to='prize_images/', blank=True, null=True)
     owner = models.ForeignKey(ShopOwnerProfile, on_delete=models.CASCADE, related_name="prizes")  # NEW FIELD
+    # {"webp": {"160": "<storage name>", ...}, "jpeg": {...}}, filled in by myapp.images
+    image_derivatives = models.JSONField(default=dict, blank=True)
+    # Relative odds of being drawn; 0 takes the prize off the wheel.
+    weight = models.PositiveIntegerField(default=1)
+    stock = models.PositiveIntegerField(null=True, blank=True)  # Units left; empty means unlimited
     def __str__(self):
         return f"{self.name} ({self.owner.user.username})"  # Shows ownership
 
@@ -35,6 +40,15 @@ class Coupon(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     prize_type = models.CharField(max_length=50, blank=True, null=True)
     owner = models.ForeignKey(ShopOwnerProfile, on_delete=models.CASCADE, related_name='coupons')
+    class Meta:
+        indexes = [
+            # Newest-first coupon table and keyset pages in `gen`.
+            models.Index(fields=['owner', '-id'], name='coupon_owner_id_idx'),
+            # Per-owner counts and filters by status.
+            models.Index(fields=['owner', 'status'], name='coupon_owner_status_idx'),
+            # Active coupons per owner, ordered for expiry checks.
+            models.Index(fields=['owner', 'expiry_date'], condition=models.Q(status='Active'), name='coupon_owner_active_idx'),
+        ]
     def __str__(self):
         return f"{self.code} ({self.status})"
 
@@ -45,9 +59,32 @@ class CustomerWinner(models.Model):
     prize = models.ForeignKey(Prize, on_delete=models.SET_NULL, null=True)
     redeemed_at = models.DateTimeField(auto_now_add=True)
     owner = models.ForeignKey(ShopOwnerProfile, on_delete=models.CASCADE, related_name="winners")  # NEW FIELD
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', '-redeemed_at'], name='winner_owner_redeemed_idx'),
+        ]
     def __str__(self):
-        prize_name = self.prize.name if self.prize else 'No Prize'
-        return f"{self.customer_name} - {prize_name} ({self.owner.user.username})"
+        # Only the prize is looked up; select_related('prize') makes it free.
+        prize_name = self.prize.name if self.prize_id else 'No Prize'
+        return f"{self.customer_name} - {prize_name}"
+
+class DailyRollup(models.Model):
+    # Per-owner daily counters kept current by myapp.rollups inside the
+    # generation and redemption transactions. prize_key is the Prize.pk for
+    # redemptions and 0 for generated and expiring coupons, which carry no
+    # prize; a plain integer, so the history outlives the prize.
+    owner = models.ForeignKey(ShopOwnerProfile, on_delete=models.CASCADE, related_name="rollups")
+    day = models.DateField()
+    prize_key = models.PositiveIntegerField(default=0)
+    generated = models.IntegerField(default=0)
+    redeemed = models.IntegerField(default=0)
+    expired = models.IntegerField(default=0)  # Coupons expiring on `day` and never redeemed
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'day', 'prize_key'], name='rollup_owner_day_prize_uniq'),
+        ]
+    def __str__(self):
+        return f"{self.day} #{self.prize_key}: +{self.generated} / {self.redeemed} redeemed / {self.expired} expired"
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -62,9 +99,55 @@ class UserProfile(models.Model):
 class PaymentRequest(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payment_requests')
     upi_name = models.CharField(max_length=255)
-    upi_id = models.CharField(max_length=100)
+    upi_id = models.CharField(max_length=100, db_index=True)  # Exact-match admin search
     is_confirmed = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     confirmed_at = models.DateTimeField(null=True, blank=True)
     def __str__(self):
         return f"PaymentRequest by {self.user.username} - {self.upi_id} - Confirmed: {self.is_confirmed}"
+
+class CouponCodeSequence(models.Model):
+    # Single-row counter; coupon codes are a keyed permutation of its values.
+    next_value = models.PositiveBigIntegerField(default=0)
+    def __str__(self):
+        return f"Next coupon code #{self.next_value}"
+
+class StoredBlob(models.Model):
+    # One content-addressed media file and how many field values point at it.
+    name = models.CharField(max_length=100, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+class Job(models.Model):
+    # A long owner operation run by `manage.py run_jobs`; see myapp/jobs.py.
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    KIND_CHOICES = (
+        ('generate_coupons', 'Generate coupons'),
+        ('export_coupons', 'Export coupons'),
+        ('delete_coupons', 'Delete coupons'),
+    )
+    owner = models.ForeignKey(ShopOwnerProfile, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    progress_done = models.PositiveBigIntegerField(default=0)
+    progress_total = models.PositiveBigIntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    class Meta:
+        indexes = [
+            # Workers claim the oldest queued job.
+            models.Index(fields=['status', 'id'], name='job_status_idx'),
+        ]
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.status})"
@@ -0,0 +1,89 @@
+"""Caching for rendered pages and layout fragments.
+
+Both are keyed on `template_version()`, a digest of every template source
+and the static manifest, so a deploy that changes either starts from a cold
+cache instead of serving stale markup.
+"""
+import hashlib
+import os
+from functools import cache as memoize, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template import engines
+
+
+def _loader_dirs(loaders):
+    for loader in loaders:
+        # The cached loader wraps the loaders that actually read files.
+        yield from _loader_dirs(getattr(loader, 'loaders', ()))
+        if hasattr(loader, 'get_dirs'):
+            yield from loader.get_dirs()
+
+
+def _template_dirs():
+    """Every directory the configured template loaders read from."""
+    dirs = []
+    for engine in engines.all():
+        if hasattr(engine, 'engine'):
+            dirs.extend(_loader_dirs(engine.engine.template_loaders))
+        else:
+            dirs.extend(engine.template_dirs)
+    return list(dict.fromkeys(str(directory) for directory in dirs))
+
+
+@memoize
+def template_version():
+    digest = hashlib.sha256()
+    paths = []
+    for directory in _template_dirs():
+        for root, _, filenames in os.walk(directory):
+            paths.extend(os.path.join(root, filename) for filename in filenames)
+    if settings.STATIC_ROOT:
+        paths.append(os.path.join(settings.STATIC_ROOT, 'staticfiles.json'))
+    for path in sorted(paths):
+        if os.path.isfile(path):
+            digest.update(path.encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def cache_anonymous_page(view):
+    """Serve `view` from the cache to visitors without a session cookie.
+
+    Such visitors can't be logged in, so the response is the same for all of
+    them and neither the session nor the user has to be loaded. Responses
+    that set cookies or use a CSRF token are never cached.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if (
+            request.method not in ('GET', 'HEAD')
+            or request.GET
+            or settings.SESSION_COOKIE_NAME in request.COOKIES
+        ):
+            return view(request, *args, **kwargs)
+
+        key = f'page:{template_version()}:{request.path}'
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view(request, *args, **kwargs)
+        if (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        ):
+            cache.set(
+                key,
+                (response.content, response['Content-Type']),
+                getattr(settings, 'PAGE_CACHE_TIMEOUT', 600),
+            )
+        return response
+
+    return wrapped
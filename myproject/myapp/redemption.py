@@ -0,0 +1,256 @@
+import random
+from collections import Counter
+from dataclasses import dataclass
+
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import rollups, signedcodes
+from .catalogue import bump_catalogue_version, prize_catalogue
+from .draws import DRAW_ATTEMPTS, draw_prize_id
+from .models import Coupon, CustomerWinner, Prize
+from .stats import invalidate_owner_stats
+
+REDEEMED = 'redeemed'
+VALID = 'valid'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+ALREADY_USED = 'already_used'
+INVALID_PRIZE = 'invalid_prize'
+MISSING_FIELDS = 'missing_fields'
+OUT_OF_STOCK = 'out_of_stock'
+NO_PRIZES = 'no_prizes'
+
+MESSAGES = {
+    REDEEMED: "Coupon redeemed.",
+    VALID: "Coupon valid.",
+    INVALID: "Coupon invalid, used, or not owned by you.",
+    EXPIRED: "Coupon expired.",
+    ALREADY_USED: "Coupon has already been redeemed.",
+    INVALID_PRIZE: "Prize does not exist.",
+    MISSING_FIELDS: "All fields are required.",
+    OUT_OF_STOCK: "This prize is out of stock.",
+    NO_PRIZES: "No prizes available currently.",
+}
+
+MAX_BATCH_ITEMS = 500
+BATCH_FIELDS = ('code', 'name', 'contact', 'prize_id')
+
+
+@dataclass(frozen=True)
+class RedemptionResult:
+    status: str
+    winner: CustomerWinner = None
+
+    @property
+    def success(self):
+        return self.status in (REDEEMED, VALID)
+
+    @property
+    def message(self):
+        return MESSAGES[self.status]
+
+    def as_json(self):
+        return {'success': self.success, 'status': self.status, 'message': self.message}
+
+
+def _check(coupon, today):
+    """Why a `values('id', 'status', 'expiry_date')` row can't be redeemed, or None."""
+    if coupon is None or coupon['status'] == 'Expired':
+        return INVALID
+    if coupon['status'] == 'Used':
+        return ALREADY_USED
+    if coupon['expiry_date'] and coupon['expiry_date'] < today:
+        return EXPIRED
+    return None
+
+
+def _take_stock(prize, n):
+    """Take `n` units of `prize` in the current transaction; return whether there were enough.
+
+    Prizes with unlimited stock, as the caller loaded them, cost no query.
+    The catalogue only needs to know whether a prize can still be drawn, so
+    its version is bumped when the last unit goes rather than on every unit.
+    """
+    if prize.stock is None:
+        return True
+    rows = Prize.objects.filter(pk=prize.pk)
+    if rows.filter(stock__gt=n).update(stock=F('stock') - n):
+        return True
+    if not rows.filter(stock=n).update(stock=0):
+        return False
+    bump_catalogue_version(prize.owner_id)
+    return True
+
+
+def check_signed(code, owner_id, today=None):
+    """CPU-only verdict for a signed code: VALID, INVALID or EXPIRED; None for legacy codes."""
+    if not signedcodes.is_signed(code):
+        return None
+    verdict = signedcodes.verify(code, owner_id, today)
+    if verdict == signedcodes.VALID:
+        return VALID
+    return EXPIRED if verdict == signedcodes.EXPIRED else INVALID
+
+
+def redeem(owner_id, code, prize, name, contact):
+    """Mark `code` as used and record the winner, or report why it can't be.
+
+    The status flip is a conditional UPDATE on `status='Active'`, so when two
+    requests race for the same coupon exactly one of them gets a row back.
+    The prize's stock is taken in the same transaction; when it has run out
+    nothing is written and the result is OUT_OF_STOCK.
+    """
+    # Forged, foreign and expired signed codes never reach the database.
+    verdict = check_signed(code, owner_id)
+    if verdict in (INVALID, EXPIRED):
+        return RedemptionResult(verdict)
+
+    with transaction.atomic():
+        coupon = (
+            Coupon.objects.filter(code=code, owner_id=owner_id)
+            .values('id', 'status', 'expiry_date')
+            .first()
+        )
+        problem = _check(coupon, timezone.now().date())
+        if problem:
+            return RedemptionResult(problem)
+
+        if not Coupon.objects.filter(pk=coupon['id'], status='Active').update(status='Used'):
+            return RedemptionResult(ALREADY_USED)
+        if prize is not None and not _take_stock(prize, 1):
+            transaction.set_rollback(True)
+            return RedemptionResult(OUT_OF_STOCK)
+
+        winner = CustomerWinner.objects.create(
+            customer_name=name,
+            mobile_number=contact,
+            coupon_id=coupon['id'],
+            prize=prize,
+            owner_id=owner_id,
+        )
+        rollups.record_redeemed(owner_id, [(winner.prize_id, coupon['expiry_date'])])
+        invalidate_owner_stats(owner_id)
+    return RedemptionResult(REDEEMED, winner)
+
+
+def redeem_draw(owner_id, code, name, contact, rng=random):
+    """Draw one of the owner's prizes by weight and redeem `code` with it.
+
+    Prizes come from the cached catalogue and draw table, so unless the
+    prize has limited stock no prize row is read or written. A prize that
+    ran out after the table was cached is redrawn, up to DRAW_ATTEMPTS times.
+    The prize won is `result.winner.prize`.
+    """
+    result = RedemptionResult(NO_PRIZES)
+    for _ in range(DRAW_ATTEMPTS):
+        prize_id = draw_prize_id(owner_id, rng)
+        entry = next((p for p in prize_catalogue(owner_id) if p['id'] == prize_id), None)
+        if entry is None:
+            return result
+        prize = Prize(
+            pk=entry['id'], owner_id=owner_id, name=entry['name'], weight=entry['weight'], stock=entry['stock'],
+        )
+        result = redeem(owner_id, code, prize, name, contact)
+        if result.status != OUT_OF_STOCK:
+            return result
+        bump_catalogue_version(owner_id)
+    return result
+
+
+def _clean_item(item):
+    """`item`'s batch fields as strings (or None), or None if one is neither a string nor an integer."""
+    cleaned = {}
+    for field in BATCH_FIELDS:
+        value = item.get(field)
+        if isinstance(value, bool) or not isinstance(value, (str, int, type(None))):
+            return None
+        cleaned[field] = value if value is None or isinstance(value, str) else str(value)
+    return cleaned
+
+
+def redeem_batch(owner_id, items, commit=True):
+    """Validate, or with `commit` redeem, many `{code, name, contact, prize_id}` items at once.
+
+    Returns one RedemptionResult per item, in order. The work is set-based:
+    one `code__in` fetch, one prize fetch, one conditional UPDATE, one stock
+    UPDATE per prize won and one bulk_create of winners, all in a single
+    transaction. Items beyond a prize's remaining stock get OUT_OF_STOCK, and
+    items with a field that is neither a string nor an integer get INVALID.
+    """
+    if len(items) > MAX_BATCH_ITEMS:
+        raise ValueError(f"At most {MAX_BATCH_ITEMS} items per batch.")
+
+    items = [_clean_item(item) for item in items]
+    today = timezone.now().date()
+    with transaction.atomic():
+        codes = {item['code'] for item in items if item and item['code']}
+        coupons = Coupon.objects.filter(owner_id=owner_id, code__in=codes)
+        if commit:
+            coupons = coupons.select_for_update()
+        coupons = {c['code']: c for c in coupons.values('id', 'code', 'status', 'expiry_date')}
+        expiry_dates = {c['id']: c['expiry_date'] for c in coupons.values()}
+        prize_ids = {item['prize_id'] for item in items if item and item['prize_id']}
+        prizes = Prize.objects.filter(owner_id=owner_id, pk__in=[p for p in prize_ids if p.isdecimal()])
+        if commit:
+            prizes = prizes.select_for_update()
+        prizes = {str(prize.pk): prize for prize in prizes}
+        # Units handed out per prize in this batch, checked against the locked stock.
+        units = Counter()
+
+        statuses, winners, claimed = [], [], set()
+        for item in items:
+            if item is None:
+                statuses.append(INVALID)
+                continue
+            code = item['code']
+            if commit and not all(item[field] for field in BATCH_FIELDS):
+                statuses.append(MISSING_FIELDS)
+                continue
+            coupon = coupons.get(code)
+            problem = check_signed(code, owner_id, today) if code else None
+            if problem == VALID:
+                problem = None
+            problem = problem or _check(coupon, today)
+            if not problem and code in claimed:
+                problem = ALREADY_USED
+            if not problem and commit and item['prize_id'] not in prizes:
+                problem = INVALID_PRIZE
+            if not problem and commit:
+                prize = prizes[item['prize_id']]
+                if prize.stock is not None and units[prize.pk] >= prize.stock:
+                    problem = OUT_OF_STOCK
+            if problem:
+                statuses.append(problem)
+                continue
+            claimed.add(code)
+            if not commit:
+                statuses.append(VALID)
+                continue
+            statuses.append(REDEEMED)
+            units[prize.pk] += 1
+            winners.append(CustomerWinner(
+                customer_name=item['name'],
+                mobile_number=item['contact'],
+                coupon_id=coupon['id'],
+                prize=prizes[item['prize_id']],
+                owner_id=owner_id,
+            ))
+
+        if winners:
+            ids = [winner.coupon_id for winner in winners]
+            if Coupon.objects.filter(pk__in=ids, status='Active').update(status='Used') != len(ids):
+                # The rows were locked above, so this only happens on backends
+                # without row locks; give up rather than record a double win.
+                raise DatabaseError("Coupons changed during batch redemption.")
+            for prize_id, n in units.items():
+                prize = prizes[str(prize_id)]
+                if not _take_stock(prize, n):
+                    raise DatabaseError("Prize stock changed during batch redemption.")
+            CustomerWinner.objects.bulk_create(winners)
+            rollups.record_redeemed(owner_id, [(winner.prize_id, expiry_dates[winner.coupon_id]) for winner in winners])
+            invalidate_owner_stats(owner_id)
+
+    winners = iter(winners)
+    return [RedemptionResult(status, next(winners) if status == REDEEMED else None) for status in statuses]
@@ -0,0 +1,145 @@
+"""Daily per-owner rollups of coupons generated, redeemed and expired.
+
+Counters live in DailyRollup and are bumped with an upsert inside the same
+transaction that creates coupons or records winners, so they never drift
+from the raw rows. Expiry is booked ahead: generating coupons adds them to
+`expired` on their expiry day and redeeming one takes it back off, so for
+past days `expired` is exactly the coupons that lapsed unredeemed; charts
+show it for past days only.
+
+`rebuild()` recomputes an owner's rows from Coupon and CustomerWinner, for
+the initial backfill and after any out-of-band change. Deleted coupons keep
+their history in the rollups, so a rebuild after a delete-all drops it.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Coupon, CustomerWinner, DailyRollup, Prize
+
+COUNTERS = ('generated', 'redeemed', 'expired')
+# Days shown on the dashboard trend.
+TREND_DAYS = 30
+
+
+def _upsert_sql():
+    qn = connection.ops.quote_name
+    table = qn(DailyRollup._meta.db_table)
+    keys = [qn(DailyRollup._meta.get_field(name).column) for name in ('owner', 'day', 'prize_key')]
+    counters = [qn(name) for name in COUNTERS]
+    columns = ', '.join(keys + counters)
+    updates = ', '.join(f'{c} = {table}.{c} + excluded.{c}' for c in counters)
+    return (
+        f'INSERT INTO {table} ({columns}) VALUES ({", ".join(["%s"] * len(keys + counters))}) '
+        f'ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {updates}'
+    )
+
+
+def record(owner_id, changes):
+    """Add `changes` to the owner's rollups.
+
+    `changes` maps `(day, prize_key, counter)` to an amount, which may be
+    negative. Call inside the transaction that made the change.
+    """
+    rows = Counter()
+    for (day, prize_key, counter), amount in changes.items():
+        if amount:
+            rows[(day, prize_key, COUNTERS.index(counter))] += amount
+    params = []
+    for (day, prize_key, index), amount in rows.items():
+        values = [0, 0, 0]
+        values[index] = amount
+        params.append([owner_id, day, prize_key, *values])
+    if params:
+        with connection.cursor() as cursor:
+            cursor.executemany(_upsert_sql(), params)
+
+
+def record_generated(owner_id, quantity, expiry_date=None):
+    changes = {(timezone.localdate(), 0, 'generated'): quantity}
+    if expiry_date:
+        changes[(expiry_date, 0, 'expired')] = quantity
+    record(owner_id, changes)
+
+
+def record_redeemed(owner_id, redemptions):
+    """Book `(prize_id, coupon_expiry_date)` pairs as redeemed today."""
+    today = timezone.localdate()
+    changes = Counter()
+    for prize_id, expiry_date in redemptions:
+        changes[(today, prize_id or 0, 'redeemed')] += 1
+        if expiry_date:
+            changes[(expiry_date, 0, 'expired')] -= 1
+    record(owner_id, changes)
+
+
+def record_deleted(owner_id, pending):
+    """Take back the expiry booked for deleted coupons that hadn't lapsed yet.
+
+    `pending` holds `(expiry_date, count)` pairs. Generated and redeemed
+    counts, and expiries already past, stay: they are history.
+    """
+    record(owner_id, {(day, 0, 'expired'): -n for day, n in pending})
+
+
+def discard(owner_id):
+    """Forget an owner's rollups before rebuilding them."""
+    DailyRollup.objects.filter(owner_id=owner_id).delete()
+
+
+def rebuild(owner_id):
+    """Recompute the owner's rollups from their coupons and winners; return the rows written.
+
+    The counts are read inside the transaction that rewrites the rows, so a
+    generation or redemption can't commit in between and be lost.
+    """
+    with transaction.atomic():
+        changes = Counter()
+        coupons = Coupon.objects.filter(owner_id=owner_id).order_by()
+        for day, n in coupons.values_list(TruncDate('created_at')).annotate(n=Count('id')):
+            changes[(day, 0, 'generated')] += n
+        lapsing = coupons.filter(expiry_date__isnull=False).exclude(status='Used')
+        for day, n in lapsing.values_list('expiry_date').annotate(n=Count('id')):
+            changes[(day, 0, 'expired')] += n
+        winners = CustomerWinner.objects.filter(owner_id=owner_id).order_by()
+        for day, prize_id, n in winners.values_list(TruncDate('redeemed_at'), 'prize_id').annotate(n=Count('id')):
+            changes[(day, prize_id or 0, 'redeemed')] += n
+
+        discard(owner_id)
+        record(owner_id, changes)
+        return DailyRollup.objects.filter(owner_id=owner_id).count()
+
+
+def owner_trend(owner_id, days=TREND_DAYS):
+    """Daily totals and per-prize redemptions for the last `days` days, today included.
+
+    Returns `(per_day, per_prize)`: one `{day, generated, redeemed, expired}`
+    dict per day, oldest first and including empty days, and
+    `{name, redeemed}` dicts, most redeemed first. Today's `expired` is
+    left out: those coupons can still be redeemed.
+    """
+    today = timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    rollups = DailyRollup.objects.filter(owner_id=owner_id, day__gte=start, day__lte=today).order_by()
+    totals = {
+        day: counts
+        for day, *counts in rollups.values_list('day').annotate(*(Sum(name) for name in COUNTERS))
+    }
+    per_day = []
+    for i in range(days):
+        day = start + timedelta(days=i)
+        per_day.append({'day': day, **dict(zip(COUNTERS, totals.get(day, (0, 0, 0))))})
+    per_day[-1]['expired'] = 0
+    by_prize = dict(
+        rollups.filter(~Q(prize_key=0)).values_list('prize_key').annotate(n=Sum('redeemed')).filter(n__gt=0)
+    )
+    names = dict(Prize.objects.filter(pk__in=by_prize).values_list('pk', 'name'))
+    per_prize = sorted(
+        ({'name': names.get(key, 'Deleted prize'), 'redeemed': n} for key, n in by_prize.items()),
+        key=lambda row: -row['redeemed'],
+    )
+    return per_day, per_prize
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalogue import bump_catalogue_version
+from .entitlements import invalidate_entitlement
+from .images import delete_derivatives
+from .models import Prize, ShopOwnerProfile, UserProfile
+from .sqlite import configure_connection
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def userprofile_changed(sender, instance, **kwargs):
+    invalidate_entitlement(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Prize)
+def prize_changed(sender, instance, **kwargs):
+    bump_catalogue_version(instance.owner_id)
+
+
+@receiver(post_delete, sender=Prize)
+@receiver(post_delete, sender=ShopOwnerProfile)
+def release_image(sender, instance, **kwargs):
+    # Drop this row's references to its (shared, reference-counted) files.
+    image, derivatives = instance.image, getattr(instance, 'image_derivatives', None)
+
+    def release():
+        if derivatives:
+            delete_derivatives(derivatives)
+        if image:
+            image.storage.delete(image.name)
+
+    transaction.on_commit(release)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    configure_connection(connection)
@@ -0,0 +1,19 @@
+"""Per-connection SQLite settings for running under several worker processes.
+
+`configure_connection` runs from the `connection_created` signal and applies
+`settings.SQLITE_PRAGMAS`. With WAL, readers no longer block the writer and
+vice versa; `busy_timeout` makes a second writer wait for the lock instead of
+failing with "database is locked"; `synchronous=NORMAL` is durable in WAL
+mode except across power loss; `mmap_size` lets reads skip a copy.
+"""
+from django.conf import settings
+
+
+def configure_connection(connection, pragmas=None):
+    if connection.vendor != 'sqlite':
+        return
+    if pragmas is None:
+        pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,160 @@
+"""Hashed, precompressed static files and a middleware that serves them.
+
+`collectstatic` with `CompressedManifestStaticFilesStorage` writes each file
+under a content-hashed name and, for text formats, `.gz` and `.br` siblings
+compressed once at build time. `StaticFilesMiddleware` serves STATIC_ROOT
+from an index built at startup: it picks the smallest variant the client's
+`Accept-Encoding` allows and marks hashed names as immutable, so nothing is
+compressed or stat'ed per request.
+"""
+import gzip
+import json
+import mimetypes
+import os
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse
+
+try:
+    import brotli
+except ImportError:  # .br variants are skipped without the brotli package
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.scss'}
+# Keep a variant only if it saves at least this fraction of the original.
+MIN_SAVING = 0.05
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _compressors():
+    yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+
+        def convert_or_keep(matchobj):
+            # Leave references to files we don't ship (e.g. absent source
+            # maps) as they are instead of failing the whole build.
+            try:
+                return converter(matchobj)
+            except ValueError:
+                return matchobj.group(0)
+
+        return convert_or_keep
+
+    def stored_name(self, name):
+        # Same leniency for `{% static %}`: a template linking a missing file
+        # gets its plain URL (and a 404) rather than a 500 for the page.
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(paths) | set(self.hashed_files.values()):
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                self._write_compressed(name)
+
+    def _write_compressed(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        for suffix, compress in _compressors():
+            compressed = compress(data)
+            if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def accepted_encodings(header):
+    """Content codings with a non-zero q-value in an Accept-Encoding header."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """Serve collected static files with precompressed variants and far-future caching."""
+
+    ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        root = settings.STATIC_ROOT
+        if settings.DEBUG or not root or not os.path.isfile(os.path.join(root, 'staticfiles.json')):
+            # Development serves from the finders via runserver.
+            raise MiddlewareNotUsed
+        self.prefix = urlsplit(settings.STATIC_URL).path
+        if not self.prefix.startswith('/'):
+            self.prefix = '/' + self.prefix
+        self.max_age = getattr(settings, 'STATIC_MAX_AGE', 60)
+        self.files = self._index(root)
+
+    def _index(self, root):
+        with open(os.path.join(root, 'staticfiles.json')) as f:
+            hashed = set(json.load(f)['paths'].values())
+        files = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                if name.endswith(('.gz', '.br')) or name == 'staticfiles.json':
+                    continue
+                variants = [
+                    (encoding, path + suffix, os.path.getsize(path + suffix))
+                    for encoding, suffix in self.ENCODINGS
+                    if os.path.exists(path + suffix)
+                ]
+                variants.sort(key=lambda variant: variant[2])
+                files[name] = {
+                    'path': path,
+                    'variants': variants,
+                    'content_type': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                    'cache_control': IMMUTABLE_CACHE_CONTROL if name in hashed else f'public, max-age={self.max_age}',
+                }
+        return files
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            entry = self.files.get(request.path[len(self.prefix):])
+            if entry is not None:
+                return self.serve(request, entry)
+        return self.get_response(request)
+
+    def serve(self, request, entry):
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        path, encoding = entry['path'], None
+        for variant_encoding, variant_path, _ in entry['variants']:
+            if variant_encoding in accepted:
+                path, encoding = variant_path, variant_encoding
+                break
+        response = FileResponse(open(path, 'rb'), content_type=entry['content_type'])
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if entry['variants']:
+            response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = entry['cache_control']
+        return response
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import CustomerWinner, ShopOwnerProfile
+
+EMPTY_STATS = {
+    'coupons_created': 0,
+    'coupons_active': 0,
+    'coupons_used': 0,
+    'coupons_expired': 0,
+    'prizes_redeemed': 0,
+}
+
+
+def _cache_key(owner_id):
+    return f'owner-stats:{owner_id}'
+
+
+def _query_stats(owner_id):
+    winners = (
+        CustomerWinner.objects.filter(owner_id=OuterRef('pk'))
+        .order_by()
+        .values('owner_id')
+        .annotate(n=Count('*'))
+        .values('n')
+    )
+    row = (
+        ShopOwnerProfile.objects.filter(pk=owner_id)
+        .values('pk')
+        .annotate(
+            coupons_created=Count('coupons'),
+            coupons_active=Count('coupons', filter=Q(coupons__status='Active')),
+            coupons_used=Count('coupons', filter=Q(coupons__status='Used')),
+            coupons_expired=Count('coupons', filter=Q(coupons__status='Expired')),
+            prizes_redeemed=Coalesce(Subquery(winners, output_field=IntegerField()), Value(0)),
+        )
+        .values(*EMPTY_STATS)
+        .first()
+    )
+    return row or dict(EMPTY_STATS)
+
+
+def owner_stats(owner):
+    """Per-owner coupon and redemption counters, computed in one query and cached."""
+    if owner is None:
+        return dict(EMPTY_STATS)
+    key = _cache_key(owner.pk)
+    stats = cache.get(key)
+    if stats is None:
+        stats = _query_stats(owner.pk)
+        cache.set(key, stats, getattr(settings, 'OWNER_STATS_CACHE_TIMEOUT', 300))
+    return stats
+
+
+def invalidate_owner_stats(owner_id):
+    # Drop the entry now for this process's next read, and again once the
+    # surrounding transaction commits so a concurrent reader can't re-cache
+    # pre-commit counts.
+    key = _cache_key(owner_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,114 @@
+"""Content-addressed, reference-counted media storage.
+
+Uploads are hashed while they are streamed to a temporary file and then
+stored once under `blobs/<aa>/<sha256><ext>`, whatever `upload_to` says, so
+the same bytes uploaded as a prize and as a profile picture share one file.
+Each `save()` adds a reference and each `delete()` drops one; the file is
+removed with its last reference. Names that aren't blobs (files written
+before the switch) are deleted as usual.
+
+A new blob's file is moved into place before the transaction that counts it
+commits, so a rollback can leave a file with no StoredBlob row. `orphans()`
+finds those once they are older than ORPHAN_GRACE_SECONDS, and
+`dedupe_media` removes them.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+from .models import StoredBlob
+
+BLOB_DIR = 'blobs'
+# Files younger than this may belong to a transaction that is still open.
+ORPHAN_GRACE_SECONDS = 3600
+
+
+def blob_name(digest, ext):
+    return posixpath.join(BLOB_DIR, digest[:2], digest + ext.lower())
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content, not from `name`.
+        return name
+
+    def _save(self, name, content):
+        os.makedirs(self.location, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.location, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            stored = blob_name(digest.hexdigest(), posixpath.splitext(name)[1])
+            with transaction.atomic():
+                # Lock the row first so a concurrent delete of the last
+                # reference can't remove the file we are about to count.
+                blob, created = StoredBlob.objects.select_for_update().get_or_create(
+                    name=stored, defaults={'size': size}
+                )
+                path = self.path(stored)
+                # A new row replaces any orphan left by a rolled-back save,
+                # which also restarts its grace period.
+                if created or not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(tmp_path, self.file_permissions_mode)
+                    os.replace(tmp_path, path)
+                StoredBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return stored
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return super().delete(name)
+            if blob.refcount > 1:
+                StoredBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') - 1)
+                return
+            blob.delete()
+            super().delete(name)
+
+    def references(self, name):
+        return StoredBlob.objects.filter(name=name).values_list('refcount', flat=True).first() or 0
+
+    def orphans(self, grace=ORPHAN_GRACE_SECONDS):
+        """Names of blob files with no StoredBlob row, left untouched for over `grace` seconds."""
+        root = self.path(BLOB_DIR)
+        if not os.path.isdir(root):
+            return
+        cutoff = time.time() - grace
+        for shard in sorted(os.listdir(root)):
+            directory = os.path.join(root, shard)
+            if not os.path.isdir(directory):
+                continue
+            prefix = posixpath.join(BLOB_DIR, shard, '')
+            known = set(StoredBlob.objects.filter(name__startswith=prefix).values_list('name', flat=True))
+            for filename in sorted(os.listdir(directory)):
+                name = prefix + filename
+                if name not in known and os.path.getmtime(os.path.join(directory, filename)) < cutoff:
+                    yield name
+
+    def delete_orphan(self, name):
+        """Remove an orphaned blob file, unless a save has counted it since."""
+        with transaction.atomic():
+            if not StoredBlob.objects.select_for_update().filter(name=name).exists():
+                super().delete(name)
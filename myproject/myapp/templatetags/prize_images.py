@@ -0,0 +1,27 @@
+from django import template
+from django.core.files.storage import default_storage
+
+register = template.Library()
+
+
+@register.filter
+def prize_srcset(prize, fmt='webp'):
+    """`srcset` value for a prize's `fmt` derivatives, or '' until they exist."""
+    names = (prize.image_derivatives or {}).get(fmt, {})
+    return ', '.join(
+        f'{default_storage.url(name)} {width}w'
+        for width, name in sorted(names.items(), key=lambda item: int(item[0]))
+    )
+
+
+@register.filter
+def prize_image_url(prize, width=320):
+    """URL of the smallest JPEG derivative at least `width` wide, falling back to the original."""
+    names = (prize.image_derivatives or {}).get('jpeg', {})
+    widths = sorted(int(w) for w in names)
+    for w in widths:
+        if w >= int(width):
+            return default_storage.url(names[str(w)])
+    if widths:
+        return default_storage.url(names[str(widths[-1])])
+    return prize.image.url if prize.image else ''
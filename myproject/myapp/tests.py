@@ -1,3 +1,1466 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import CommandError, call_command
+from django.templatetags.static import static
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+
+from . import codefilter, jobs, signedcodes, staticfiles
+from .codefilter import BloomFilter
+from .coupons import CODE_SPACE, allocate_coupon_codes, bulk_create_coupons, encode_code, permute
+from .listing import PAGE_SIZE, EstimatedCountPaginator
+from .deletion import delete_owner_coupons
+from .draws import AliasTable, draw_prize_id, prize_table
+from .entitlements import confirm_payments, get_entitlement
+from .backends import users_matching
+from .catalogue import bump_catalogue_version, catalogue_version, prize_catalogue
+from .images import build_derivatives, render_derivatives, schedule_derivatives
+from .models import (
+    ShopOwnerProfile, Coupon, CustomerWinner, DailyRollup, Job, PaymentRequest, Prize, Register, StoredBlob,
+    UserProfile,
+)
+from .pagecache import template_version
+from .redemption import (
+    ALREADY_USED, EXPIRED, INVALID, NO_PRIZES, OUT_OF_STOCK, REDEEMED, redeem, redeem_batch, redeem_draw,
+)
+from .rollups import owner_trend, rebuild
+from .stats import owner_stats
+from .storage import ORPHAN_GRACE_SECONDS
+from .views import validate_coupon
+from .winners import filter_winners
+from PIL import Image
+
+# Keep test runs out of the shared file cache, whatever runner starts them.
+_private_cache = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+
+
+def setUpModule():
+    _private_cache.enable()
+
+
+def tearDownModule():
+    _private_cache.disable()
+
+
+class BulkCreateCouponsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shop', email='shop@example.com', password='pass12345')
+        self.owner = ShopOwnerProfile.objects.create(user=self.user)
+
+    def test_creates_unique_codes_and_updates_total(self):
+        created = bulk_create_coupons(self.owner, 1200, expiry_date='2030-01-01', prize_type='Gift')
+
+        self.assertEqual(created, 1200)
+        codes = list(Coupon.objects.filter(owner=self.owner).values_list('code', flat=True))
+        self.assertEqual(len(codes), 1200)
+        self.assertEqual(len(set(codes)), 1200)
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.total_coupons_created, 1200)
+
+    def test_query_count_grows_per_batch_not_per_code(self):
+        allocate_coupon_codes(1)
+        with CaptureQueriesContext(connection) as queries:
+            bulk_create_coupons(self.owner, 100, batch_size=50)
+
+        # One insert and a savepoint pair per batch, plus the block reservation,
+        # the total update and read-back, the rollup upsert and the outer
+        # savepoint pair.
+        self.assertLessEqual(len(queries), 2 * 3 + 7)
+        self.assertFalse(any(q['sql'].startswith('SELECT "myapp_coupon"') for q in queries))
+
+    def test_gen_view_uses_bulk_path(self):
+        self.client.force_login(self.user)
+        response = self.client.post('/gen/', {'coupon_quantity': 5, 'expiry_date': '2030-01-01', 'prize_type': 'Gift'})
+
+        self.assertRedirects(response, '/gen/', fetch_redirect_response=False)
+        self.assertEqual(Coupon.objects.filter(owner=self.owner, prize_type='Gift').count(), 5)
+
+    def test_gen_view_rejects_bad_expiry_with_a_specific_message(self):
+        self.client.force_login(self.user)
+        for expiry, signed, message in (
+            ('2030-02-30', '', "Expiry date must be a valid date (YYYY-MM-DD)."),
+            ('next week', '', "Expiry date must be a valid date (YYYY-MM-DD)."),
+            ('2099-01-01', 'on', "Signed codes need an expiry date between 2024-01-01 and 2068-11-07."),
+            ('2023-12-31', 'on', "Signed codes need an expiry date between 2024-01-01 and 2068-11-07."),
+        ):
+            with self.subTest(expiry=expiry):
+                response = self.client.post(
+                    '/gen/', {'coupon_quantity': 5, 'expiry_date': expiry, 'signed_codes': signed}, follow=True
+                )
+                self.assertEqual([str(m) for m in response.context['messages']], [message])
+        self.assertFalse(Coupon.objects.exists())
+
+    def test_oversized_owner_id_is_reported_as_such(self):
+        with self.assertRaisesMessage(ValueError, "first 1048575 shops"):
+            signedcodes.sign(1 << 20, 0)
+
+
+class CouponCodeAllocatorTests(TestCase):
+    def test_permutation_is_injective(self):
+        values = [permute(n) for n in range(20000)]
+        self.assertEqual(len(set(values)), len(values))
+        self.assertTrue(all(0 <= v < CODE_SPACE for v in values))
+
+    def test_codes_keep_existing_format(self):
+        self.assertEqual(encode_code(0), 'AAAAAAAA')
+        self.assertEqual(encode_code(CODE_SPACE - 1), '99999999')
+        for code in allocate_coupon_codes(100):
+            self.assertRegex(code, r'^[A-Z0-9]{8}$')
+
+    def test_blocks_never_overlap(self):
+        first = allocate_coupon_codes(300)
+        second = allocate_coupon_codes(300)
+        self.assertEqual(len(set(first) | set(second)), 600)
+
+    def test_allocation_is_one_round_trip_per_block(self):
+        allocate_coupon_codes(1)
+        with self.assertNumQueries(2):
+            allocate_coupon_codes(1000)
+
+
+class DownloadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shop', email='shop@example.com', password='pass12345')
+        self.owner = ShopOwnerProfile.objects.create(user=self.user)
+        bulk_create_coupons(self.owner, 30, prize_type='Gift')
+        Coupon.objects.filter(owner=self.owner, id__in=Coupon.objects.values('id')[:10]).update(status='Used')
+        self.client.force_login(self.user)
+
+    def test_streams_all_rows(self):
+        response = self.client.get('/download/')
+
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'Code,Prize,Expiry Date,Status,Created At')
+        self.assertEqual(len(lines), 31)
+
+    def test_status_filter_and_gzip(self):
+        response = self.client.get('/download/', {'status': 'Used', 'gzip': '1'})
+
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="coupons.csv.gz"')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 11)
+        self.assertTrue(all(line.split(',')[3] == 'Used' for line in lines[1:]))
+
+    def test_date_filter(self):
+        response = self.client.get('/download/', {'from': '2999-01-01'})
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+
+
+class CouponTablePaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shop', email='shop@example.com', password='pass12345')
+        self.owner = ShopOwnerProfile.objects.create(user=self.user)
+        bulk_create_coupons(self.owner, 120, prize_type='Gift')
+        bulk_create_coupons(self.owner, 5, prize_type='Voucher')
+        self.client.force_login(self.user)
+
+    def test_gen_renders_first_page_only(self):
+        response = self.client.get('/gen/')
+
+        self.assertEqual(len(response.context['coupons']), PAGE_SIZE)
+        self.assertTrue(response.context['next_url'].startswith('/gen/coupons/?before='))
+
+    def test_fragment_endpoint_walks_every_coupon_once(self):
+        seen = [c.code for c in self.client.get('/gen/').context['coupons']]
+        url = self.client.get('/gen/').context['next_url']
+        while url:
+            data = self.client.get(url).json()
+            seen += re.findall(r'<td>([A-Z0-9]{8})</td>', data['html'])
+            url = data['next']
+
+        self.assertEqual(len(seen), 125)
+        self.assertEqual(set(seen), set(Coupon.objects.values_list('code', flat=True)))
+
+    def test_filters_apply_to_page(self):
+        response = self.client.get('/gen/', {'prize_type': 'Voucher'})
+
+        self.assertEqual(len(response.context['coupons']), 5)
+        self.assertIsNone(response.context['next_url'])
+
+
+class HotQueryPlanTests(TestCase):
+    """Each owner-scoped hot query must be answered from an index, never a table scan."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='shop', email='shop@example.com', password='pass12345')
+        self.owner = ShopOwnerProfile.objects.create(user=self.user)
+        bulk_create_coupons(self.owner, 50, expiry_date='2030-01-01', prize_type='Gift')
+
+    def hot_queries(self):
+        owner = self.owner
+        return {
+            'gen page': Coupon.objects.filter(owner=owner).order_by('-id')[:PAGE_SIZE + 1],
+            'gen next page': Coupon.objects.filter(owner=owner, id__lt=10 ** 6).order_by('-id')[:PAGE_SIZE + 1],
+            'coupons created': Coupon.objects.filter(owner=owner).values('id'),
+            'coupons used': Coupon.objects.filter(owner=owner, status='Used').values('id'),
+            'active coupons': Coupon.objects.filter(owner=owner, status='Active').order_by('expiry_date'),
+            'validate coupon': Coupon.objects.filter(code='ABCDEFGH', status='Active', owner=owner),
+            'winners': CustomerWinner.objects.filter(owner=owner).order_by('-redeemed_at'),
+            'winners page': filter_winners(
+                CustomerWinner.objects.filter(owner=owner), {'from': '2030-01-01', 'to': '2030-01-31'}
+            ).order_by('-id')[:PAGE_SIZE + 1],
+            'admin payment search': PaymentRequest.objects.filter(
+                Q(upi_id='shop@upi') | Q(user__in=users_matching(username='shop', email='shop'))
+            ),
+        }
+
+    def assertNoTableScan(self, name, queryset):
+        plan = queryset.explain()
+        table = queryset.model._meta.db_table
+        if connection.vendor == 'postgresql':
+            searched = 'Seq Scan' not in plan
+        else:
+            # Any SCAN of the table, even of a covering index, reads every row.
+            searched = re.search(rf'\bSEARCH {table}\b', plan) and not re.search(rf'\bSCAN {table}\b', plan)
+        self.assertTrue(searched, f"{name} falls back to a table scan:\n{plan}")
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(name):
+                self.assertNoTableScan(name, queryset)
+
+
+class RedemptionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shop', email='shop@example.com', password='pass12345')
+        self.owner = ShopOwnerProfile.objects.create(user=self.user)
+        self.prize = Prize.objects.create(name='Candy', owner=self.owner)
+        self.code = allocate_coupon_codes(1)[0]
+        Coupon.objects.create(code=self.code, owner=self.owner, expiry_date='2999-01-01')
+
+    def test_redeems_once(self):
+        first = redeem(self.owner.id, self.code, self.prize, 'Asha', '9999999999')
+        second = redeem(self.owner.id, self.code, self.prize, 'Ravi', '8888888888')
+
+        self.assertEqual(first.status, REDEEMED)
+        self.assertEqual(second.status, ALREADY_USED)
+        self.assertEqual(CustomerWinner.objects.get().customer_name, 'Asha')
+        self.assertEqual(Coupon.objects.get(code=self.code).status, 'Used')
+
+    def test_rejects_expired_and_foreign_codes(self):
+        Coupon.objects.filter(code=self.code).update(expiry_date='2000-01-01')
+        other = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='other'))
+
+        self.assertEqual(redeem(self.owner.id, self.code, self.prize, 'Asha', '1').status, EXPIRED)
+        self.assertEqual(redeem(other.id, self.code, self.prize, 'Asha', '1').status, INVALID)
+        self.assertFalse(CustomerWinner.objects.exists())
+
+    def test_redeem_coupon_view_returns_contract(self):
+        response = self.client.post('/redeem_coupon/', {
+            'coupon': self.code, 'name': 'Asha', 'contact': '1', 'prize_id': self.prize.id,
+        })
+
+        self.assertEqual(
+            response.json(),
+            {'success': True, 'status': REDEEMED, 'message': 'Coupon redeemed.', 'prize_id': self.prize.id},
+        )
+
+
+class ConcurrentRedemptionTests(TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        self.owner = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='shop'))
+        self.prize = Prize.objects.create(name='TV', owner=self.owner)
+        self.codes = allocate_coupon_codes(5)
+        for code in self.codes:
+            Coupon.objects.create(code=code, owner=self.owner)
+
+    def _spin(self, barrier, code, results):
+        barrier.wait()
+        try:
+            while True:
+                try:
+                    results.append(redeem(self.owner.id, code, self.prize, 'Customer', '1').status)
+                    return
+                except OperationalError:
+                    # SQLite refuses a second concurrent writer outright; a real
+                    # client would retry, so do the same until there is a verdict.
+                    time.sleep(0.001)
+        finally:
+            connections.close_all()
+
+    def test_exactly_one_winner_per_code_under_contention(self):
+        for code in self.codes:
+            barrier = threading.Barrier(self.threads)
+            results = []
+            workers = [
+                threading.Thread(target=self._spin, args=(barrier, code, results))
+                for _ in range(self.threads)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+            self.assertEqual(results.count(REDEEMED), 1, results)
+            self.assertEqual(results.count(ALREADY_USED), self.threads - 1, results)
+            self.assertEqual(CustomerWinner.objects.filter(coupon__code=code).count(), 1)
+
+
+class OwnerStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='shop', email='shop@example.com', password='pass12345')
+        self.owner = ShopOwnerProfile.objects.create(user=self.user)
+        self.prize = Prize.objects.create(name='Candy', owner=self.owner)
+        bulk_create_coupons(self.owner, 6)
+        Coupon.objects.filter(id__in=Coupon.objects.values('id')[:1]).update(status='Expired')
+        redeem(self.owner.id, Coupon.objects.filter(status='Active').first().code, self.prize, 'Asha', '1')
+
+    def test_counts_in_one_query_then_cached(self):
+        cache.clear()
+        with self.assertNumQueries(1):
+            stats = owner_stats(self.owner)
+        with self.assertNumQueries(0):
+            owner_stats(self.owner)
+
+        self.assertEqual(stats, {
+            'coupons_created': 6,
+            'coupons_active': 4,
+            'coupons_used': 1,
+            'coupons_expired': 1,
+            'prizes_redeemed': 1,
+        })
+
+    def test_invalidated_on_create_and_redeem(self):
+        owner_stats(self.owner)
+        bulk_create_coupons(self.owner, 2)
+        self.assertEqual(owner_stats(self.owner)['coupons_created'], 8)
+
+        redeem(self.owner.id, Coupon.objects.filter(status='Active').first().code, self.prize, 'Ravi', '2')
+        self.assertEqual(owner_stats(self.owner)['prizes_redeemed'], 2)
+
+    def test_invalidated_on_delete_all(self):
+        owner_stats(self.owner)
+        self.client.force_login(self.user)
+        self.client.post('/gen/', {'delete_all_coupons': '1'})
+        jobs.run_pending()
+
+        self.assertEqual(owner_stats(self.owner)['coupons_created'], 0)
+
+
+class EntitlementTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='shop', email='shop@example.com', password='pass12345')
+        ShopOwnerProfile.objects.create(user=self.user)
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.request = RequestFactory().get('/dash/')
+        self.request.user = self.user
+
+    def test_memoised_per_request_and_cached_per_user(self):
+        with self.assertNumQueries(1):
+            self.assertFalse(get_entitlement(self.request).is_active)
+            get_entitlement(self.request)
+
+        request = RequestFactory().get('/gen/')
+        request.user = self.user
+        with self.assertNumQueries(0):
+            get_entitlement(request)
+
+    def test_invalidated_when_profile_saved(self):
+        get_entitlement(self.request)
+        self.profile.package_active = True
+        self.profile.plan_expiration_date = date.today() + timedelta(days=3)
+        self.profile.save()
+
+        request = RequestFactory().get('/gen/')
+        request.user = self.user
+        self.assertTrue(get_entitlement(request).is_active)
+
+    def test_confirm_payments_extends_plans_in_bulk(self):
+        today = timezone.now().date()
+        other = User.objects.create_user(username='other')
+        UserProfile.objects.create(user=other, package_active=True, plan_expiration_date=today + timedelta(days=10))
+        PaymentRequest.objects.create(user=self.user, upi_name='A', upi_id='a@upi')
+        PaymentRequest.objects.create(user=self.user, upi_name='A', upi_id='a@upi')
+        PaymentRequest.objects.create(user=other, upi_name='B', upi_id='b@upi')
+        get_entitlement(self.request)
+
+        confirmed = confirm_payments(PaymentRequest.objects.all())
+
+        self.assertEqual(confirmed, 3)
+        self.assertFalse(PaymentRequest.objects.filter(is_confirmed=False).exists())
+        self.assertEqual(UserProfile.objects.get(user=self.user).plan_expiration_date, today + timedelta(days=60))
+        self.assertEqual(UserProfile.objects.get(user=other).plan_expiration_date, today + timedelta(days=40))
+        request = RequestFactory().get('/gen/')
+        request.user = self.user
+        self.assertTrue(get_entitlement(request).is_active)
+        self.assertEqual(confirm_payments(PaymentRequest.objects.all()), 0)
+
+
+class CodeFilterTests(TestCase):
+    def setUp(self):
+        codefilter._filters.clear()
+        self.user = User.objects.create_user(username='shop', email='shop@example.com', password='pass12345')
+        self.owner = ShopOwnerProfile.objects.create(user=self.user)
+        bulk_create_coupons(self.owner, 200)
+        self.owner.refresh_from_db()
+        self.client.force_login(self.user)
+
+    def validate(self, code):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/validate_coupon/', {'coupon': code}).json()
+        return data, [q['sql'] for q in queries if 'myapp_coupon' in q['sql']]
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        codes = allocate_coupon_codes(1000)
+        for code in codes:
+            bloom.add(code)
+        self.assertTrue(all(code in bloom for code in codes))
+        misses = sum(code in bloom for code in allocate_coupon_codes(5000))
+        self.assertLess(misses, 5000 * 0.03)
+
+    def test_unknown_code_rejected_without_coupon_query(self):
+        self.validate('WARMUP00')
+        data, coupon_queries = self.validate('NOPE0000')
+
+        self.assertFalse(data['valid'])
+        self.assertEqual(coupon_queries, [])
+        self.assertGreaterEqual(codefilter.counters['rejected'], 1)
+
+    def test_unknown_code_rejected_without_any_query(self):
+        self.validate('WARMUP00')
+        request = RequestFactory().get('/validate_coupon/', {'coupon': 'NOPE0000'})
+        request.user = self.user
+        request.session = {'_owner_id': self.owner.pk}
+        with self.assertNumQueries(0):
+            response = validate_coupon(request)
+        self.assertFalse(json.loads(response.content)['valid'])
+
+    def test_issued_codes_still_validate(self):
+        code = Coupon.objects.filter(owner=self.owner).first().code
+        data, coupon_queries = self.validate(code)
+
+        self.assertTrue(data['valid'])
+        self.assertEqual(len(coupon_queries), 3)  # filter build (count + load), then the lookup
+
+    def test_codes_generated_later_are_picked_up(self):
+        self.validate('WARMUP00')
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_create_coupons(self.owner, 3)
+        code = Coupon.objects.filter(owner=self.owner).order_by('-id').first().code
+
+        data, coupon_queries = self.validate(code)
+        self.assertTrue(data['valid'])
+        self.assertEqual(len(coupon_queries), 3)  # stale after the generation, so rebuilt
+
+    def test_codes_generated_by_another_process_trigger_rebuild(self):
+        self.validate('WARMUP00')
+        code = allocate_coupon_codes(1)[0]
+        Coupon.objects.create(code=code, owner=self.owner)
+        codefilter.bump_generation(self.owner.pk)
+
+        self.assertTrue(self.validate(code)[0]['valid'])
+
+    def test_rebuild_does_not_block_other_lookups(self):
+        entered, release, built = threading.Event(), threading.Event(), threading.Event()
+
+        def slow_build(owner_id, generation):
+            if owner_id == self.owner.pk:
+                entered.set()
+                release.wait(5)
+                built.set()
+            return codefilter._OwnerCodes(BloomFilter(codefilter.MIN_CAPACITY), generation)
+
+        with mock.patch.object(codefilter, '_build', side_effect=slow_build):
+            rebuild = threading.Thread(target=codefilter.might_exist, args=(self.owner.pk, 'NOPE0000'))
+            rebuild.start()
+            entered.wait(5)
+            codefilter.might_exist(self.owner.pk + 1, 'NOPE0000')
+            self.assertFalse(built.is_set())
+            release.set()
+            rebuild.join()
+        self.assertEqual(codefilter._filters[self.owner.pk].generation, codefilter.generation(self.owner.pk))
+
+
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        codefilter._filters.clear()
+        self.user = User.objects.create_user(username='shop', email='shop@example.com', password='pass12345')
+        self.owner = ShopOwnerProfile.objects.create(user=self.user)
+        self.prize = Prize.objects.create(name='Candy', owner=self.owner)
+        bulk_create_coupons(self.owner, 3)
+        self.owner.refresh_from_db()
+        self.code = Coupon.objects.first().code
+
+    def test_validate_matches_sync_view(self):
+        self.client.force_login(self.user)
+        for code in (self.code, 'NOPE0000', ''):
+            with self.subTest(code=code):
+                self.assertEqual(
+                    self.client.get('/async/validate_coupon/', {'coupon': code}).json(),
+                    self.client.get('/validate_coupon/', {'coupon': code}).json(),
+                )
+
+    def test_redeem_once(self):
+        data = {'coupon': self.code, 'name': 'Asha', 'contact': '1', 'prize_id': self.prize.id}
+
+        self.assertEqual(self.client.post('/async/redeem_coupon/', data).json()['status'], REDEEMED)
+        self.assertEqual(self.client.post('/async/redeem_coupon/', data).json()['status'], ALREADY_USED)
+        self.assertEqual(CustomerWinner.objects.count(), 1)
+
+
+class BatchRedemptionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shop', email='shop@example.com', password='pass12345')
+        self.owner = ShopOwnerProfile.objects.create(user=self.user)
+        self.prize = Prize.objects.create(name='Candy', owner=self.owner)
+        bulk_create_coupons(self.owner, 300, expiry_date='2999-01-01')
+        self.codes = list(Coupon.objects.order_by('id').values_list('code', flat=True))
+        Coupon.objects.filter(code=self.codes[1]).update(status='Used')
+        Coupon.objects.filter(code=self.codes[2]).update(expiry_date='2000-01-01')
+        self.client.force_login(self.user)
+
+    def post(self, action, items):
+        return self.client.post(
+            '/batch_coupons/', json.dumps({'action': action, 'items': items}), content_type='application/json'
+        ).json()
+
+    def item(self, code, **extra):
+        return dict({'code': code, 'name': 'Asha', 'contact': '1', 'prize_id': self.prize.id}, **extra)
+
+    def test_per_item_statuses(self):
+        items = [
+            self.item(self.codes[0]),
+            self.item(self.codes[1]),
+            self.item(self.codes[2]),
+            self.item('NOPE0000'),
+            self.item(self.codes[0]),
+            self.item(self.codes[3], prize_id=10 ** 6),
+            self.item(self.codes[4], name=''),
+        ]
+        data = self.post('redeem', items)
+
+        self.assertEqual(
+            [r['status'] for r in data['results']],
+            [REDEEMED, ALREADY_USED, EXPIRED, INVALID, ALREADY_USED, 'invalid_prize', 'missing_fields'],
+        )
+        self.assertEqual(data['results'][0]['code'], self.codes[0])
+        self.assertEqual(CustomerWinner.objects.count(), 1)
+
+    def test_redeems_hundreds_with_constant_queries(self):
+        items = [self.item(code) for code in self.codes[3:]]
+        with CaptureQueriesContext(connection) as queries:
+            data = self.post('redeem', items)
+
+        self.assertEqual(data['summary'], {REDEEMED: 297})
+        self.assertEqual(CustomerWinner.objects.count(), 297)
+        self.assertLess(len(queries), 15)
+
+    def test_validate_does_not_write(self):
+        data = self.post('validate', [{'code': self.codes[0]}, {'code': self.codes[1]}])
+
+        self.assertEqual([r['status'] for r in data['results']], ['valid', ALREADY_USED])
+        self.assertEqual(Coupon.objects.filter(status='Used').count(), 1)
+
+    def test_rejects_oversized_batches(self):
+        response = self.client.post(
+            '/batch_coupons/', json.dumps({'items': [{}] * 501}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_fields_are_invalid(self):
+        items = [
+            self.item(['x']),
+            self.item(12345678),
+            self.item(self.codes[0], contact={'n': 1}),
+            self.item(self.codes[0], prize_id='\u00b2'),
+            self.item(self.codes[0], contact=5551234),
+        ]
+        data = self.post('redeem', items)
+
+        self.assertEqual([r['status'] for r in data['results']], [INVALID, INVALID, INVALID, 'invalid_prize', REDEEMED])
+        self.assertEqual(CustomerWinner.objects.get().mobile_number, '5551234')
+
+    def test_requires_csrf_token_and_json(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        body = json.dumps({'items': [self.item(self.codes[0])]})
+
+        self.assertEqual(client.post('/batch_coupons/', body, content_type='text/plain').status_code, 403)
+        self.assertEqual(client.post('/batch_coupons/', body, content_type='application/json').status_code, 403)
+        self.assertEqual(self.client.post('/batch_coupons/', body, content_type='text/plain').status_code, 415)
+        self.assertFalse(CustomerWinner.objects.exists())
+
+
+class SignedCodeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shop', email='shop@example.com', password='pass12345')
+        self.owner = ShopOwnerProfile.objects.create(user=self.user)
+        self.other = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='other'))
+        self.prize = Prize.objects.create(name='Candy', owner=self.owner)
+        bulk_create_coupons(self.owner, 5, expiry_date='2040-01-01', signed=True)
+        self.code = Coupon.objects.filter(owner=self.owner).first().code
+        self.client.force_login(self.user)
+
+    def test_format_and_round_trip(self):
+        codes = list(Coupon.objects.values_list('code', flat=True))
+        self.assertEqual(len(set(codes)), 5)
+        for code in codes:
+            self.assertRegex(code, r'^[A-Z0-9]{18}$')
+            self.assertEqual(signedcodes.verify(code, self.owner.id), signedcodes.VALID)
+
+    def test_rejects_forged_foreign_and_expired(self):
+        tampered = self.code[:-1] + ('0' if self.code[-1] != '0' else '1')
+        expired = signedcodes.sign(self.owner.id, 99, date(2024, 6, 1))
+
+        self.assertEqual(signedcodes.verify(tampered, self.owner.id), signedcodes.FORGED)
+        self.assertEqual(signedcodes.verify(self.code, self.other.id), signedcodes.WRONG_OWNER)
+        self.assertEqual(signedcodes.verify(expired, self.owner.id), signedcodes.EXPIRED)
+
+    def test_validate_needs_no_coupon_query(self):
+        self.client.get('/validate_coupon/', {'coupon': self.code})  # remembers the owner id in the session
+        for code, valid in ((self.code, True), (self.code[:-1] + 'Z', False)):
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get('/validate_coupon/', {'coupon': code}).json()
+            self.assertEqual(data['valid'], valid)
+            self.assertFalse([q for q in queries if 'myapp_' in q['sql']])
+
+    def test_redeem_rejects_forgeries_without_db_and_accepts_real_codes(self):
+        with self.assertNumQueries(0):
+            result = redeem(self.other.id, self.code, self.prize, 'Asha', '1')
+        self.assertEqual(result.status, INVALID)
+
+        self.assertEqual(redeem(self.owner.id, self.code, self.prize, 'Asha', '1').status, REDEEMED)
+        self.assertEqual(redeem(self.owner.id, self.code, self.prize, 'Asha', '1').status, ALREADY_USED)
+
+    def test_legacy_codes_still_work_alongside(self):
+        bulk_create_coupons(self.owner, 1)
+        legacy = Coupon.objects.get(code__regex=r'^[A-Z0-9]{8}$').code
+
+        self.assertTrue(self.client.get('/validate_coupon/', {'coupon': legacy}).json()['valid'])
+        self.assertEqual(redeem(self.owner.id, legacy, self.prize, 'Asha', '1').status, REDEEMED)
+
+
+def _png(width, height, name='prize.png', color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class PrizeImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media, PRIZE_IMAGES_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='shop', password='pass12345')
+        self.owner = ShopOwnerProfile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def test_upload_builds_resized_webp_and_jpeg(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/manage-prizes/', {'name': 'Teddy', 'image': _png(1200, 600)})
+        prize = Prize.objects.get()
+
+        self.assertEqual(set(prize.image_derivatives), {'webp', 'jpeg'})
+        for fmt, pil_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            self.assertEqual(sorted(prize.image_derivatives[fmt], key=int), ['160', '320', '640'])
+            with default_storage.open(prize.image_derivatives[fmt]['320']) as f:
+                image = Image.open(f)
+                self.assertEqual((image.format, image.size), (pil_format, (320, 160)))
+
+        html = self.client.get('/manage-prizes/').content.decode()
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('.webp 640w', html)
+
+    def test_small_images_are_not_upscaled(self):
+        prize = Prize.objects.create(name='Pin', image=_png(200, 100), owner=self.owner)
+        derivatives = build_derivatives(prize.pk)
+        self.assertEqual(sorted(derivatives['jpeg'], key=int), ['160', '200'])
+
+    def test_replacing_image_drops_old_derivatives(self):
+        prize = Prize.objects.create(name='Pin', image=_png(400, 400, 'old.png'), owner=self.owner)
+        old = build_derivatives(prize.pk)['webp']['160']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/update-prize/{prize.pk}/', {'name': 'Pin', 'image': _png(400, 400, 'new.png', (0, 0, 255))})
+        prize.refresh_from_db()
+
+        self.assertFalse(default_storage.exists(old))
+        self.assertNotEqual(prize.image_derivatives['webp']['160'], old)
+        self.assertTrue(default_storage.exists(prize.image_derivatives['webp']['160']))
+
+    def test_rolled_back_replacement_keeps_old_derivatives(self):
+        prize = Prize.objects.create(name='Pin', image=_png(400, 400), owner=self.owner)
+        build_derivatives(prize.pk)
+        prize.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    schedule_derivatives(prize)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        prize.refresh_from_db()
+
+        self.assertTrue(prize.image_derivatives)
+        self.assertTrue(default_storage.exists(prize.image_derivatives['webp']['160']))
+
+    def test_rebuilding_releases_replaced_derivatives(self):
+        prize = Prize.objects.create(name='Pin', image=_png(400, 400), owner=self.owner)
+        build_derivatives(prize.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            derivatives = build_derivatives(prize.pk)
+
+        names = {name for names in derivatives.values() for name in names.values()}
+        self.assertEqual(StoredBlob.objects.count(), len(names) + 1)
+        self.assertEqual(set(StoredBlob.objects.values_list('refcount', flat=True)), {1})
+
+    def test_derivatives_of_a_replaced_image_are_released(self):
+        prize = Prize.objects.create(name='Pin', image=_png(400, 400), owner=self.owner)
+
+        def render_then_replace(*args):
+            rendered = render_derivatives(*args)
+            Prize.objects.filter(pk=prize.pk).update(image='prize_images/other.png')
+            return rendered
+
+        with mock.patch('myapp.images.render_derivatives', side_effect=render_then_replace), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(build_derivatives(prize.pk))
+        self.assertEqual(list(StoredBlob.objects.values_list('name', flat=True)), [prize.image.name])
+        self.assertEqual(Prize.objects.get().image_derivatives, {})
+
+    def test_originals_with_the_same_stem_keep_their_own_derivatives(self):
+        storage = FileSystemStorage(location=self.media)
+        first = storage.save('prize_images/prize.png', _png(400, 400))
+        second = storage.save('prize_images/prize.jpg', _png(400, 400, color=(0, 0, 255)))
+        a = render_derivatives(first, 1, storage)
+        b = render_derivatives(second, 2, storage)
+        again = render_derivatives(first, 1, storage)
+
+        names = [names[w] for d in (a, b, again) for names in d.values() for w in names]
+        self.assertEqual(len(set(names)), len(names))
+        self.assertTrue(all(storage.exists(name) for name in names))
+
+    def test_without_derivatives_templates_fall_back_to_original(self):
+        Prize.objects.create(name='Pin', image=_png(400, 400), owner=self.owner)
+        html = self.client.get('/manage-prizes/').content.decode()
+        self.assertIn(f'src="{Prize.objects.get().image.url}"', html)
+        self.assertNotIn('srcset', html)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.owner = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='shop'))
+
+    def test_identical_uploads_share_one_refcounted_blob(self):
+        first = Prize.objects.create(name='A', image=_png(50, 50, 'me.png'), owner=self.owner)
+        second = Prize.objects.create(name='B', image=_png(50, 50, 'me.png'), owner=self.owner)
+        self.owner.image = _png(50, 50, 'avatar.png')
+        self.owner.save()
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image.name, self.owner.image.name)
+        self.assertEqual(StoredBlob.objects.get().refcount, 3)
+        self.assertEqual(len(os.listdir(os.path.dirname(default_storage.path(first.image.name)))), 1)
+
+    def test_file_is_removed_with_its_last_reference(self):
+        first = Prize.objects.create(name='A', image=_png(50, 50), owner=self.owner)
+        second = Prize.objects.create(name='B', image=_png(50, 50), owner=self.owner)
+        name = first.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(StoredBlob.objects.exists())
+
+    def test_dedupe_media_removes_blobs_of_rolled_back_saves(self):
+        kept = Prize.objects.create(name='A', image=_png(50, 50), owner=self.owner).image.name
+        try:
+            with transaction.atomic():
+                orphan = Prize.objects.create(name='B', image=_png(60, 60), owner=self.owner).image.name
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        self.assertTrue(default_storage.exists(orphan))
+        self.assertEqual(list(default_storage.orphans()), [])
+
+        with mock.patch('myapp.storage.time.time', return_value=time.time() + 2 * ORPHAN_GRACE_SECONDS):
+            call_command('dedupe_media', stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(kept))
+
+    def test_dedupe_media_migrates_existing_files(self):
+        legacy = FileSystemStorage()
+        names = [legacy.save('prize_images/me.png', _png(50, 50)) for _ in range(2)]
+        Prize.objects.bulk_create(Prize(name=n, image=n, owner=self.owner) for n in names)
+
+        out = io.StringIO()
+        call_command('dedupe_media', stdout=out)
+
+        self.assertEqual(len(set(Prize.objects.values_list('image', flat=True))), 1)
+        self.assertEqual(StoredBlob.objects.get().refcount, 2)
+        self.assertFalse(any(legacy.exists(n) for n in names))
+        self.assertIn(f"reclaimed {legacy.size(Prize.objects.first().image.name)} bytes", out.getvalue())
+
+
+class StaticPipelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.static_root, ignore_errors=True)
+        settings_override = override_settings(
+            STATIC_ROOT=cls.static_root,
+            STORAGES={
+                'default': {'BACKEND': 'myapp.storage.ContentAddressedStorage'},
+                'staticfiles': {'BACKEND': 'myapp.staticfiles.CompressedManifestStaticFilesStorage'},
+            },
+        )
+        settings_override.enable()
+        cls.addClassCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_templates_link_hashed_names(self):
+        html = self.client.get('/login/').content.decode()
+        self.assertRegex(html, r'/static/css/add\.[0-9a-f]{12}\.css')
+
+    def test_serves_precompressed_variant_by_accept_encoding(self):
+        url = static('css/bootstrap.min.css')
+        with open(os.path.join(self.static_root, 'css', 'bootstrap.min.css'), 'rb') as f:
+            original = f.read()
+
+        decoders = {None: bytes, 'gzip': gzip.decompress}
+        cases = [('gzip', 'gzip'), ('br;q=0, gzip', 'gzip'), ('', None)]
+        if staticfiles.brotli is not None:
+            decoders['br'] = staticfiles.brotli.decompress
+            cases.append(('gzip, deflate, br', 'br'))
+        for accept, encoding in cases:
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING=accept)
+            self.assertEqual(response.get('Content-Encoding'), encoding)
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertEqual(decoders[encoding](b''.join(response.streaming_content)), original)
+
+    def test_unhashed_names_are_not_immutable(self):
+        response = self.client.get('/static/css/add.css', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_hits_skip_the_view(self):
+        first = self.client.get('/about/')
+        with mock.patch('myapp.views.render') as render:
+            second = self.client.get('/about/')
+        render.assert_not_called()
+        self.assertEqual(second.content, first.content)
+
+    def test_session_holders_and_query_strings_bypass_the_cache(self):
+        self.client.get('/about/')
+        with mock.patch('myapp.views.render', return_value=HttpResponse('fresh')) as render:
+            self.client.get('/about/', {'ref': 'ad'})
+            self.client.force_login(User.objects.create_user(username='shop'))
+            self.assertEqual(self.client.get('/about/').content, b'fresh')
+        self.assertEqual(render.call_count, 2)
+
+
+    def test_editing_a_template_changes_the_version(self):
+        probe = os.path.join(os.path.dirname(__file__), 'templates', '_version_probe.html')
+        self.addCleanup(template_version.cache_clear)
+        self.addCleanup(lambda: os.path.exists(probe) and os.remove(probe))
+        versions = []
+        for content in (None, 'one', 'two'):
+            if content:
+                with open(probe, 'w') as f:
+                    f.write(content)
+            template_version.cache_clear()
+            versions.append(template_version())
+        self.assertEqual(len(set(versions)), 3)
+
+
+class EmailAuthTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shop', email='Shop@Example.com', password='pass12345')
+
+    def test_login_is_case_insensitive_and_loads_user_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/login/', {'email': 'shop@example.COM', 'password': 'pass12345'})
+        self.assertRedirects(response, '/dash/', fetch_redirect_response=False)
+        self.assertEqual(len([q for q in queries if 'FROM "auth_user"' in q['sql']]), 1)
+
+        self.client.logout()
+        response = self.client.post('/login/', {'email': 'shop@example.com', 'password': 'wrong'})
+        self.assertRedirects(response, '/login/', fetch_redirect_response=False)
+
+    def test_email_lookup_uses_the_functional_index(self):
+        sql, params = users_matching(email='x@example.com').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('auth_user_email_upper_idx', plan)
+
+    def test_register_checks_uniqueness_once_and_creates_rows_atomically(self):
+        data = {'username': 'SHOP', 'email': 'new@example.com', 'password1': 'x', 'password2': 'x'}
+        self.client.post('/register/', data)
+        self.client.post('/register/', dict(data, username='new', email='shop@EXAMPLE.com'))
+        self.assertEqual(User.objects.count(), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/register/', dict(data, username='new'))
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('SELECT') and 'auth_user' in q['sql']]), 1)
+        user = User.objects.get(username='new')
+        self.assertTrue(ShopOwnerProfile.objects.filter(user=user).exists())
+        self.assertTrue(user.registration)
+
+        with mock.patch('myapp.views.Register.objects.create', side_effect=IntegrityError):
+            self.client.post('/register/', dict(data, username='other', email='other@example.com'))
+        self.assertFalse(User.objects.filter(username='other').exists())
+
+
+class SQLiteProfileTests(TestCase):
+    def test_new_connections_get_the_configured_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+class ChunkedDeletionTests(TestCase):
+    def setUp(self):
+        self.owner = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='shop'))
+        self.other = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='other'))
+        prize = Prize.objects.create(name='TV', owner=self.owner)
+        bulk_create_coupons(self.owner, 25)
+        bulk_create_coupons(self.other, 3)
+        for code in Coupon.objects.filter(owner=self.owner).values_list('code', flat=True)[:4]:
+            redeem(self.owner.id, code, prize, 'Asha', '1')
+
+    def test_deletes_in_bounded_chunks_and_reports_progress(self):
+        reports = []
+        with CaptureQueriesContext(connection) as queries:
+            deleted = delete_owner_coupons(self.owner.id, chunk_size=10, progress=lambda *a: reports.append(a))
+
+        self.assertEqual(deleted, 25)
+        self.assertEqual(reports, [(10, 25), (20, 25), (25, 25)])
+        self.assertFalse(Coupon.objects.filter(owner=self.owner).exists())
+        self.assertFalse(CustomerWinner.objects.filter(owner=self.owner).exists())
+        self.assertEqual(Coupon.objects.filter(owner=self.other).count(), 3)
+        # Nothing is loaded row by row: no SELECT of whole coupon or winner rows.
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT "myapp_coupon"."id", "myapp_coupon"."code"')])
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT "myapp_customerwinner"')])
+
+    def test_rejects_chunk_sizes_below_one(self):
+        with self.assertRaises(ValueError):
+            delete_owner_coupons(self.owner.id, chunk_size=0)
+        with self.assertRaisesMessage(CommandError, "--chunk-size must be at least 1."):
+            call_command('delete_coupons', self.owner.user_id, chunk_size=-5)
+        self.assertEqual(Coupon.objects.filter(owner=self.owner).count(), 25)
+
+    def test_gen_delete_all_uses_the_service(self):
+        self.client.force_login(self.owner.user)
+        self.client.post('/gen/', {'delete_all_coupons': '1'})
+        self.assertTrue(Coupon.objects.filter(owner=self.owner).exists())
+        jobs.run_pending()
+        self.assertFalse(Coupon.objects.filter(owner=self.owner).exists())
+        self.assertEqual(owner_stats(self.owner)['coupons_created'], 0)
+
+
+class JobRunnerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='shop'))
+        self.client.force_login(self.owner.user)
+        self.export_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.export_dir, ignore_errors=True)
+
+    @override_settings(JOB_INLINE_COUPONS=5)
+    def test_large_generation_is_queued_and_counts_against_the_limit(self):
+        self.client.post('/gen/', {'coupon_quantity': '8', 'expiry_date': '', 'prize_type': 'TV'})
+        self.assertFalse(Coupon.objects.filter(owner=self.owner).exists())
+        self.assertEqual(jobs.pending_generation(self.owner), 8)
+
+        # Only 2 of the free 10 are left while the job is queued.
+        self.client.post('/gen/', {'coupon_quantity': '5', 'expiry_date': '', 'prize_type': 'TV'})
+        self.assertEqual(Job.objects.filter(owner=self.owner).count(), 1)
+
+        self.assertEqual(jobs.run_pending(), 1)
+        job = Job.objects.get(owner=self.owner)
+        self.assertEqual(Coupon.objects.filter(owner=self.owner, prize_type='TV').count(), 8)
+        self.assertEqual(jobs.job_status(job), {
+            'id': job.pk, 'kind': jobs.GENERATE, 'status': jobs.DONE, 'done': 8, 'total': 8,
+            'percent': 100, 'result': {'created': 8}, 'error': '',
+        })
+        self.assertEqual(jobs.pending_generation(self.owner), 0)
+
+    def test_export_job_writes_a_downloadable_file(self):
+        bulk_create_coupons(self.owner, 3, prize_type='TV')
+        bulk_create_coupons(self.owner, 2, prize_type='Mug')
+        with override_settings(JOB_EXPORT_DIR=self.export_dir):
+            response = self.client.post('/jobs/export/', {'prize_type': 'TV', 'ignored': 'x'})
+            self.assertEqual(response.status_code, 202)
+            job = Job.objects.get(pk=response.json()['id'])
+            self.assertEqual(job.params, {'prize_type': 'TV'})
+            self.assertEqual(self.client.get(f'/jobs/{job.pk}/download/').status_code, 404)
+
+            jobs.run_pending()
+            status = self.client.get(response.json()['status_url']).json()
+            self.assertEqual(status['status'], jobs.DONE)
+            download = self.client.get(status['download_url'])
+            rows = gzip.decompress(b''.join(download.streaming_content)).decode().splitlines()
+        self.assertEqual(rows[0], 'Code,Prize,Expiry Date,Status,Created At')
+        self.assertEqual(len(rows), 4)
+
+        other = User.objects.create_user(username='other')
+        ShopOwnerProfile.objects.create(user=other)
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(f'/jobs/{job.pk}/').status_code, 404)
+
+    def test_failed_job_records_the_error(self):
+        job = jobs.enqueue(self.owner, jobs.DELETE)
+        with mock.patch.dict(jobs.HANDLERS, {jobs.DELETE: mock.Mock(side_effect=RuntimeError('disk full'))}):
+            self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, jobs.FAILED)
+        self.assertEqual(job.error, 'disk full')
+        self.assertIsNotNone(job.finished_at)
+
+    def test_a_job_is_claimed_once_and_stale_jobs_are_requeued(self):
+        first = jobs.enqueue(self.owner, jobs.DELETE)
+        second = jobs.enqueue(self.owner, jobs.DELETE)
+        self.assertEqual(jobs.claim_next().pk, first.pk)
+        self.assertEqual(jobs.claim_next().pk, second.pk)
+        self.assertIsNone(jobs.claim_next())
+
+        Job.objects.filter(pk=first.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(600), 1)
+        self.assertEqual(jobs.claim_next().pk, first.pk)
+
+
+class AdminScalabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser(username='admin', password='pass12345'))
+
+    def _shops(self, start, stop):
+        for i in range(start, stop):
+            user = User.objects.create_user(username=f'shop{i}', email=f'shop{i}@example.com')
+            UserProfile.objects.create(user=user)
+            Register.objects.create(user=user)
+            PaymentRequest.objects.create(user=user, upi_name=f'Shop {i}', upi_id=f'shop{i}@upi')
+
+    def _changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_changelists_query_count_does_not_grow_with_rows(self):
+        urls = ('/admin/myapp/paymentrequest/', '/admin/myapp/userprofile/', '/admin/myapp/register/')
+        self._shops(0, 2)
+        few = [self._changelist_queries(url) for url in urls]
+        self._shops(2, 30)
+        self.assertEqual([self._changelist_queries(url) for url in urls], few)
+
+    def test_search_matches_exact_upi_id_username_or_email(self):
+        self._shops(0, 12)
+
+        def found(term):
+            response = self.client.get('/admin/myapp/paymentrequest/', {'q': term})
+            return sorted(p.upi_id for p in response.context['cl'].result_list)
+
+        self.assertEqual(found('shop1@upi'), ['shop1@upi'])
+        self.assertEqual(found('SHOP11'), ['shop11@upi'])
+        self.assertEqual(found('shop2@example.com'), ['shop2@upi'])
+        self.assertEqual(found('shop1'), ['shop1@upi'])
+        self.assertEqual(found('hop'), [])
+
+    def test_large_unfiltered_lists_are_estimated(self):
+        self._shops(0, 8)
+        PaymentRequest.objects.filter(upi_id__in=['shop3@upi', 'shop4@upi']).delete()
+        paginator = EstimatedCountPaginator(PaymentRequest.objects.order_by('-id'), 5)
+        paginator.estimate_above = 5
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, 8)
+
+        filtered = EstimatedCountPaginator(PaymentRequest.objects.filter(is_confirmed=False).order_by('-id'), 5)
+        filtered.estimate_above = 5
+        self.assertEqual(filtered.count, 6)
+        self.assertEqual(EstimatedCountPaginator(PaymentRequest.objects.order_by('-id'), 5).count, 6)
+
+
+class WinnersReportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='shop'))
+        self.tv = Prize.objects.create(name='TV', owner=self.owner)
+        self.mug = Prize.objects.create(name='Mug', owner=self.owner)
+        bulk_create_coupons(self.owner, PAGE_SIZE + 10)
+        coupons = list(Coupon.objects.filter(owner=self.owner).order_by('id'))
+        CustomerWinner.objects.bulk_create(
+            CustomerWinner(
+                customer_name=f'Customer {i}', mobile_number=str(i), coupon=coupon, owner=self.owner,
+                prize=self.tv if i % 3 == 0 else self.mug,
+            )
+            for i, coupon in enumerate(coupons)
+        )
+        # The first 10 were redeemed two days ago, the rest today.
+        two_days_ago = timezone.now() - timedelta(days=2)
+        first_ten = CustomerWinner.objects.order_by('id').values_list('id', flat=True)[:10]
+        CustomerWinner.objects.filter(id__in=list(first_ten)).update(redeemed_at=two_days_ago)
+        self.two_days_ago = two_days_ago.date()
+        self.client.force_login(self.owner.user)
+
+    def test_page_is_keyset_paginated_with_grouped_totals(self):
+        response = self.client.get('/customer/')
+        self.assertEqual(len(response.context['redemptions']), PAGE_SIZE)
+        self.assertEqual(response.context['total_redemptions'], PAGE_SIZE + 10)
+        self.assertEqual(
+            [(row['prize__name'], row['total']) for row in response.context['per_prize']],
+            [('Mug', 40), ('TV', 20)],
+        )
+        self.assertEqual([row['total'] for row in response.context['per_day']], [PAGE_SIZE, 10])
+
+        rest = self.client.get(response.context['next_url']).json()
+        self.assertIsNone(rest['next'])
+        self.assertEqual(rest['html'].count('<tr>'), 10)
+
+    def test_query_count_does_not_depend_on_rows_listed(self):
+        with CaptureQueriesContext(connection) as full:
+            full_page = self.client.get('/customer/').context['redemptions']
+        with CaptureQueriesContext(connection) as filtered:
+            filtered_page = self.client.get('/customer/', {'prize': self.tv.pk}).context['redemptions']
+        self.assertGreater(len(full_page), len(filtered_page))
+        self.assertEqual(len(full), len(filtered))
+
+    def test_malformed_prize_filter_is_ignored(self):
+        response = self.client.get('/customer/', {'prize': '\u00b2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_redemptions'], self.client.get('/customer/').context['total_redemptions'])
+
+    def test_filters_by_date_range_and_prize(self):
+        day = self.two_days_ago.isoformat()
+        response = self.client.get('/customer/', {'from': day, 'to': day, 'prize': self.tv.pk})
+        self.assertEqual(response.context['total_redemptions'], 4)
+        self.assertTrue(all(w.prize_id == self.tv.pk for w in response.context['redemptions']))
+        self.assertIsNone(response.context['next_url'])
+
+        self.mug.delete()
+        self.assertEqual(self.client.get('/customer/', {'prize': 'none'}).context['total_redemptions'], 40)
+
+    def test_csv_export_is_streamed_and_filtered(self):
+        response = self.client.get('/customer/download/', {'prize': self.tv.pk})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'Customer Name,Mobile Number,Coupon Code,Prize,Redeemed At')
+        self.assertEqual(len(lines), 21)
+
+    def test_str_does_not_fetch_the_owner(self):
+        winner = CustomerWinner.objects.select_related('prize').first()
+        with self.assertNumQueries(0):
+            self.assertEqual(str(winner), f'{winner.customer_name} - {winner.prize.name}')
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='shop'))
+        self.prize = Prize.objects.create(name='TV', owner=self.owner)
+        self.today = timezone.localdate()
+        self.tomorrow = self.today + timedelta(days=1)
+
+    def rows(self):
+        return set(
+            DailyRollup.objects.filter(owner=self.owner)
+            .exclude(generated=0, redeemed=0, expired=0)
+            .values_list('day', 'prize_key', 'generated', 'redeemed', 'expired')
+        )
+
+    def test_generation_and_redemption_update_rollups_in_place(self):
+        bulk_create_coupons(self.owner, 5, expiry_date=self.tomorrow.isoformat())
+        bulk_create_coupons(self.owner, 3)
+        codes = list(Coupon.objects.filter(owner=self.owner, expiry_date=self.tomorrow).values_list('code', flat=True))
+        redeem(self.owner.id, codes[0], self.prize, 'Asha', '1')
+        redeem_batch(self.owner.id, [
+            {'code': code, 'name': 'Ravi', 'contact': '2', 'prize_id': self.prize.pk} for code in codes[1:3]
+        ])
+
+        self.assertEqual(self.rows(), {
+            (self.today, 0, 8, 0, 0),
+            (self.today, self.prize.pk, 0, 3, 0),
+            (self.tomorrow, 0, 0, 0, 2),
+        })
+        # A rebuild from the raw rows agrees with the incremental counts.
+        rebuild(self.owner.id)
+        self.assertEqual(self.rows(), {
+            (self.today, 0, 8, 0, 0),
+            (self.today, self.prize.pk, 0, 3, 0),
+            (self.tomorrow, 0, 0, 0, 2),
+        })
+
+    def test_rebuild_reads_inside_its_transaction(self):
+        bulk_create_coupons(self.owner, 2)
+        with CaptureQueriesContext(connection) as queries:
+            rebuild(self.owner.id)
+        self.assertTrue(queries[0]['sql'].startswith('SAVEPOINT'), queries[0]['sql'])
+
+    def test_delete_all_keeps_history_and_takes_back_pending_expiry(self):
+        two_days_ago = self.today - timedelta(days=2)
+        DailyRollup.objects.create(owner=self.owner, day=two_days_ago, generated=10, expired=4)
+        DailyRollup.objects.create(owner=self.owner, day=two_days_ago, prize_key=self.prize.pk, redeemed=6)
+        bulk_create_coupons(self.owner, 5, expiry_date=self.tomorrow.isoformat())
+        redeem(self.owner.id, Coupon.objects.filter(owner=self.owner).first().code, self.prize, 'Asha', '1')
+
+        delete_owner_coupons(self.owner.id, chunk_size=2)
+        self.assertEqual(self.rows(), {
+            (two_days_ago, 0, 10, 0, 4),
+            (two_days_ago, self.prize.pk, 0, 6, 0),
+            (self.today, 0, 5, 0, 0),
+            (self.today, self.prize.pk, 0, 1, 0),
+        })
+
+    def test_rebuild_command_backfills_existing_data(self):
+        bulk_create_coupons(self.owner, 4, expiry_date=self.tomorrow.isoformat())
+        redeem(self.owner.id, Coupon.objects.filter(owner=self.owner).first().code, self.prize, 'Asha', '1')
+        expected = self.rows()
+        DailyRollup.objects.all().delete()
+
+        out = io.StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertEqual(self.rows(), expected)
+        self.assertIn("for 1 owner(s)", out.getvalue())
+
+    def test_trend_reads_only_rollups_and_hides_pending_expiry(self):
+        two_days_ago = self.today - timedelta(days=2)
+        DailyRollup.objects.bulk_create([
+            DailyRollup(owner=self.owner, day=two_days_ago, generated=10, expired=4),
+            DailyRollup(owner=self.owner, day=two_days_ago, prize_key=self.prize.pk, redeemed=6),
+            DailyRollup(owner=self.owner, day=self.today, prize_key=999, redeemed=1, expired=3),
+        ])
+        with self.assertNumQueries(3):
+            per_day, per_prize = owner_trend(self.owner.id, days=7)
+
+        self.assertEqual(len(per_day), 7)
+        self.assertEqual(per_day[-1], {'day': self.today, 'generated': 0, 'redeemed': 1, 'expired': 0})
+        self.assertEqual(per_day[-3], {'day': two_days_ago, 'generated': 10, 'redeemed': 6, 'expired': 4})
+        self.assertEqual(per_prize, [{'name': 'TV', 'redeemed': 6}, {'name': 'Deleted prize', 'redeemed': 1}])
+
+        self.client.force_login(self.owner.user)
+        self.assertContains(self.client.get('/dash/'), 'Last 30 days')
+
+
+class PrizeDrawTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='shop'))
+        self.tv = Prize.objects.create(name='TV', owner=self.owner, weight=1, stock=1)
+        self.candy = Prize.objects.create(name='Candy', owner=self.owner, weight=500)
+
+    def test_alias_table_matches_weights(self):
+        weights = [1, 10, 100, 500, 389, 0]
+        table = AliasTable('abcdef', weights)
+        rng = random.Random(2024)
+        draws = 200000
+        counts = Counter(table.sample(rng) for _ in range(draws))
+
+        self.assertNotIn('f', counts)
+        expected = {item: draws * w / sum(weights) for item, w in zip('abcdef', weights) if w}
+        chi2 = sum((counts[item] - e) ** 2 / e for item, e in expected.items())
+        # 99.9th percentile of chi-squared with 4 degrees of freedom.
+        self.assertLess(chi2, 18.47)
+        with self.assertRaises(ValueError):
+            AliasTable([], [])
+
+    def test_table_is_cached_until_prizes_change(self):
+        self.assertIn(draw_prize_id(self.owner.pk), {self.tv.pk, self.candy.pk})
+        with self.assertNumQueries(0):
+            draw_prize_id(self.owner.pk)
+
+        self.candy.weight = 0
+        self.candy.save()
+        self.assertEqual(draw_prize_id(self.owner.pk), self.tv.pk)
+
+    def test_redemption_takes_stock_atomically(self):
+        bulk_create_coupons(self.owner, 3)
+        first, second, third = Coupon.objects.filter(owner=self.owner).values_list('code', flat=True)
+        prize_table(self.owner.pk)
+
+        self.assertEqual(redeem(self.owner.pk, first, self.tv, 'Asha', '1').status, REDEEMED)
+        self.tv.refresh_from_db()
+        self.assertEqual(self.tv.stock, 0)
+        # The last unit went, so the cached table no longer offers the TV.
+        self.assertEqual(prize_table(self.owner.pk).items, [self.candy.pk])
+
+        self.assertEqual(redeem(self.owner.pk, second, self.tv, 'Ravi', '2').status, OUT_OF_STOCK)
+        self.assertEqual(Coupon.objects.get(code=second).status, 'Active')
+        self.assertEqual(redeem(self.owner.pk, second, self.candy, 'Ravi', '2').status, REDEEMED)
+        self.candy.refresh_from_db()
+        self.assertIsNone(self.candy.stock)
+
+        Prize.objects.filter(pk=self.tv.pk).update(stock=1)
+        results = redeem_batch(self.owner.pk, [
+            {'code': code, 'name': 'Meera', 'contact': '3', 'prize_id': self.tv.pk} for code in (third, first)
+        ])
+        self.assertEqual([r.status for r in results], [REDEEMED, ALREADY_USED])
+
+    def test_batch_stops_at_remaining_stock(self):
+        Prize.objects.filter(pk=self.tv.pk).update(stock=2)
+        bulk_create_coupons(self.owner, 3)
+        codes = list(Coupon.objects.filter(owner=self.owner).values_list('code', flat=True))
+        results = redeem_batch(self.owner.pk, [
+            {'code': code, 'name': 'Meera', 'contact': '3', 'prize_id': self.tv.pk} for code in codes
+        ])
+        self.assertEqual([r.status for r in results], [REDEEMED, REDEEMED, OUT_OF_STOCK])
+        self.assertEqual(Prize.objects.get(pk=self.tv.pk).stock, 0)
+        self.assertEqual(Coupon.objects.filter(owner=self.owner, status='Active').count(), 1)
+
+    def test_spin_redraws_when_the_cached_table_is_stale(self):
+        bulk_create_coupons(self.owner, 1)
+        code = Coupon.objects.get(owner=self.owner).code
+        Prize.objects.filter(pk=self.candy.pk).update(weight=0)
+        prize_table(self.owner.pk)
+        # Behind the cache's back: the TV runs out and candy comes back.
+        Prize.objects.filter(pk=self.candy.pk).update(weight=500)
+        Prize.objects.filter(pk=self.tv.pk).update(stock=0)
+
+        self.client.force_login(self.owner.user)
+        response = self.client.post('/spin/', {'name': 'Asha', 'contact': '1', 'coupon': code})
+        self.assertEqual(response.context['prize_won'], self.candy)
+        self.assertEqual([p['id'] for p in response.context['prizes']], [self.candy.pk])
+        self.assertEqual(response.context['winning_index'], 0)
+        self.assertEqual(CustomerWinner.objects.get().prize, self.candy)
+
+
+class PrizeCatalogueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='shop'))
+        self.other = ShopOwnerProfile.objects.create(user=User.objects.create_user(username='other'))
+        self.tv = Prize.objects.create(name='TV', owner=self.owner)
+        self.mug = Prize.objects.create(name='Mug', owner=self.owner, weight=0)
+        Prize.objects.create(name='Elsewhere', owner=self.other)
+
+    def prize_queries(self, queries):
+        return [q['sql'] for q in queries if '"myapp_prize"' in q['sql']]
+
+    def test_catalogue_is_versioned_by_prize_changes(self):
+        self.assertEqual([p['name'] for p in prize_catalogue(self.owner.pk)], ['TV', 'Mug'])
+        with self.assertNumQueries(0):
+            prize_catalogue(self.owner.pk)
+
+        self.tv.name = 'Television'
+        self.tv.save()
+        self.assertEqual([p['name'] for p in prize_catalogue(self.owner.pk)], ['Television', 'Mug'])
+        self.mug.delete()
+        self.assertEqual([p['name'] for p in prize_catalogue(self.owner.pk)], ['Television'])
+        # Other owners' catalogues are untouched.
+        self.assertEqual([p['name'] for p in prize_catalogue(self.other.pk)], ['Elsewhere'])
+
+    def test_bumps_do_not_read_modify_write_the_version(self):
+        versions = [catalogue_version(self.owner.pk)]
+        for _ in range(3):
+            # A bump must not depend on the value it replaces: that read-modify-write
+            # is what lets two concurrent bumps collapse on the file cache.
+            with mock.patch.object(cache, 'get', side_effect=AssertionError), \
+                    mock.patch.object(cache, 'incr', side_effect=AssertionError):
+                bump_catalogue_version(self.owner.pk)
+            versions.append(catalogue_version(self.owner.pk))
+        self.assertEqual(len(set(versions)), 4)
+
+    def test_last_unit_bumps_the_version_without_incr(self):
+        self.tv.stock = 1
+        self.tv.save()
+        bulk_create_coupons(self.owner, 2)
+        first, second = Coupon.objects.filter(owner=self.owner).values_list('code', flat=True)
+        before = catalogue_version(self.owner.pk)
+        with mock.patch.object(cache, 'incr', side_effect=AssertionError):
+            self.assertEqual(redeem_draw(self.owner.pk, first, 'Asha', '1').status, REDEEMED)
+        self.assertNotEqual(catalogue_version(self.owner.pk), before)
+        self.assertEqual(redeem_draw(self.owner.pk, second, 'Ravi', '2').status, NO_PRIZES)
+
+    def test_qr_is_scoped_to_one_owner(self):
+        response = self.client.get(f'/qr/{self.owner.pk}/')
+        self.assertEqual([p['id'] for p in response.context['prizes']], [self.tv.pk])
+        self.assertNotContains(response, 'Elsewhere')
+        self.assertRedirects(self.client.get('/qr/'), '/login/', fetch_redirect_response=False)
+
+        self.client.force_login(self.other.user)
+        self.assertEqual([p['name'] for p in self.client.get('/qr/').context['prizes']], ['Elsewhere'])
+
+    def test_repeated_kiosk_spins_do_no_prize_queries(self):
+        bulk_create_coupons(self.owner, 3)
+        codes = list(Coupon.objects.filter(owner=self.owner).values_list('code', flat=True))
+        self.client.get(f'/qr/{self.owner.pk}/')
+
+        for code in codes:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.client.get(f'/qr/{self.owner.pk}/')
+                data = self.client.post('/redeem_coupon/', {
+                    'coupon': code, 'name': 'Asha', 'contact': '1', 'owner_id': self.owner.pk,
+                }).json()
+            self.assertEqual(page.status_code, 200)
+            self.assertTrue(data['success'], data)
+            self.assertEqual(data['prize_id'], self.tv.pk)
+            self.assertEqual(self.prize_queries(queries), [])
+        self.assertEqual(CustomerWinner.objects.filter(prize=self.tv).count(), 3)
+
+    def test_public_endpoints_ignore_a_chosen_prize(self):
+        bulk_create_coupons(self.owner, 2)
+        for url, code in zip(('/redeem_coupon/', '/async/redeem_coupon/'), Coupon.objects.values_list('code', flat=True)):
+            with self.subTest(url=url):
+                data = self.client.post(url, {
+                    'coupon': code, 'name': 'Asha', 'contact': '1', 'owner_id': self.owner.pk, 'prize_id': self.mug.pk,
+                }).json()
+                self.assertEqual(data['prize_id'], self.tv.pk)
+        self.assertFalse(CustomerWinner.objects.filter(prize=self.mug).exists())
+
+    def test_limited_stock_is_taken_and_shown_on_the_prize_page(self):
+        self.tv.stock = 2
+        self.tv.save()
+        bulk_create_coupons(self.owner, 3)
+        first, second, third = Coupon.objects.filter(owner=self.owner).values_list('code', flat=True)
+        prize_table(self.owner.pk)
+
+        # Units short of the last don't invalidate the catalogue: the only
+        # prize query is the stock UPDATE itself.
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(redeem_draw(self.owner.pk, first, 'Asha', '1').status, REDEEMED)
+        self.assertEqual(len(self.prize_queries(queries)), 1)
+        self.assertTrue(self.prize_queries(queries)[0].startswith('UPDATE'))
+
+        self.client.force_login(self.owner.user)
+        response = self.client.get('/prize/')
+        self.assertEqual([(p['name'], p['stock']) for p in response.context['prizes']], [('Mug', None), ('TV', 1)])
+
+        self.assertEqual(redeem_draw(self.owner.pk, second, 'Ravi', '2').status, REDEEMED)
+        self.assertEqual(redeem_draw(self.owner.pk, third, 'Meera', '3').status, NO_PRIZES)
+        response = self.client.get('/prize/')
+        self.assertEqual([(p['name'], p['stock']) for p in response.context['prizes']], [('Mug', None), ('TV', 0)])
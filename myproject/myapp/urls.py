@@ -1,7 +1,7 @@
 from django.urls import path
 from django.contrib import admin
 
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     # Basic site pages
@@ -19,9 +19,15 @@ urlpatterns = [
 
     # Coupon management
     path('gen/', views.gen, name='gen'),
+    path('gen/coupons/', views.gen_coupons, name='gen_coupons'),
     path('download/', views.download, name='download'),
     path('delete-all-coupons/', views.delete_all_coupons, name='delete_all_coupons'),
 
+    # Background jobs
+    path('jobs/export/', views.export_coupons, name='export_coupons'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/download/', views.job_download, name='job_download'),
+
     # Prize management
     path('manage-prizes/', views.manage_prizes, name='manage_prizes'),
     path('prize/', views.manage_prizes, name='manage_prizes'),  # optional alias
@@ -32,13 +38,22 @@ urlpatterns = [
     # Spin & Win and QR code
     path('spin/', views.spin_and_win, name='spin_and_win'),
     path('qr/', views.qr, name='qr'),
+    path('qr/<int:owner_id>/', views.qr, name='owner_qr'),
     path('update-prize/<int:prize_id>/', views.update_prize, name='update_prize'),
 
 
     # Other pages
     path('customer/', views.customer, name='customer'),
+    path('customer/winners/', views.customer_winners, name='customer_winners'),
+    path('customer/download/', views.download_winners, name='download_winners'),
 
     # AJAX endpoints
     path('validate_coupon/', views.validate_coupon, name='validate_coupon'),
     path('redeem_coupon/', views.redeem_coupon, name='redeem_coupon'),
+    path('batch_coupons/', views.batch_coupons, name='batch_coupons'),
+    path('code-filter-stats/', views.code_filter_stats, name='code_filter_stats'),
+
+    # Async AJAX endpoints (served under ASGI)
+    path('async/validate_coupon/', async_views.validate_coupon, name='async_validate_coupon'),
+    path('async/redeem_coupon/', async_views.redeem_coupon, name='async_redeem_coupon'),
 ]
@@ -1,42 +1,111 @@
-import random
+import json
+from collections import Counter
 from datetime import datetime
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, Http404, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
-import string
-from django.db import IntegrityError
+from django.db import DatabaseError, IntegrityError, transaction
 from .models import ShopOwnerProfile, Register  
 
 from django.contrib.admin.views.decorators import staff_member_required
 
 
-from .models import ShopOwnerProfile, UserProfile, Coupon, Prize, CustomerWinner, PaymentRequest
-
-
+from .models import ShopOwnerProfile, Coupon, Prize, CustomerWinner, PaymentRequest, Job
+from . import jobs
+from . import codefilter
+from .coupons import (
+    COUPON_FILTER_PARAMS, allocate_coupon_codes, bulk_create_coupons, filter_coupons, parse_expiry_date,
+)
+from .entitlements import get_entitlement
+from .exports import (
+    COUPON_EXPORT_FIELDS, COUPON_EXPORT_HEADER, EXPORT_CHUNK_SIZE, WINNER_EXPORT_FIELDS, WINNER_EXPORT_HEADER,
+    stream_csv,
+)
+from .backends import users_matching
+from .catalogue import is_drawable, prize_catalogue
+from .images import schedule_derivatives
+from .pagecache import cache_anonymous_page
+from .listing import keyset_page, parse_cursor
+from . import signedcodes
+from .redemption import EXPIRED, INVALID, MAX_BATCH_ITEMS, VALID, check_signed, redeem_batch, redeem_draw
+from .rollups import owner_trend
+from .stats import owner_stats
+from .winners import filter_winners, winner_totals
+
+
+@cache_anonymous_page
 def index(request):
     return render(request, 'index.html')
 
 
+@cache_anonymous_page
 def about(request):
     return render(request, 'about.html')
 
 
+@cache_anonymous_page
 def services(request):
     return render(request, 'services.html')
 
 
+def _winner_page(request, user_profile):
+    winners = filter_winners(CustomerWinner.objects.filter(owner=user_profile), request.GET).select_related(
+        'coupon', 'prize'
+    ).only('id', 'customer_name', 'mobile_number', 'redeemed_at', 'coupon__code', 'prize__name')
+    rows, next_cursor = keyset_page(winners, before=parse_cursor(request.GET.get('before')))
+    next_url = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['before'] = next_cursor
+        next_url = f"{reverse('customer_winners')}?{params.urlencode()}"
+    return rows, next_url
+
+
 @login_required
 def customer(request):
-    user_profile = ShopOwnerProfile.objects.get(user=request.user)
-    winners = CustomerWinner.objects.filter(owner=user_profile).select_related('coupon', 'prize').order_by('-redeemed_at')
-    return render(request, 'customer.html', {'redemptions': winners})
+    user_profile = get_object_or_404(ShopOwnerProfile, user=request.user)
+    redemptions, next_url = _winner_page(request, user_profile)
+    per_prize, per_day = winner_totals(filter_winners(CustomerWinner.objects.filter(owner=user_profile), request.GET))
+    export_params = request.GET.copy()
+    export_params.pop('before', None)
+    context = {
+        'redemptions': redemptions,
+        'next_url': next_url,
+        'filters': request.GET,
+        'prizes': Prize.objects.filter(owner=user_profile).order_by('name').values('id', 'name'),
+        'per_prize': per_prize,
+        'per_day': per_day,
+        'total_redemptions': sum(row['total'] for row in per_prize),
+        'export_query': export_params.urlencode(),
+    }
+    return render(request, 'customer.html', context)
+
+
+@login_required
+def customer_winners(request):
+    """JSON fragment with the next page of the winners table, for infinite scroll."""
+    user_profile = get_object_or_404(ShopOwnerProfile, user=request.user)
+    redemptions, next_url = _winner_page(request, user_profile)
+    html = render_to_string('winner_rows.html', {'redemptions': redemptions}, request=request)
+    return JsonResponse({'html': html, 'next': next_url})
+
+
+@login_required
+def download_winners(request):
+    user_profile = get_object_or_404(ShopOwnerProfile, user=request.user)
+    winners = filter_winners(CustomerWinner.objects.filter(owner=user_profile), request.GET)
+    rows = winners.order_by('id').values_list(*WINNER_EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return stream_csv('winners.csv', WINNER_EXPORT_HEADER, rows, compress=request.GET.get('gzip') == '1')
 
 
 def register(request):
@@ -51,17 +120,19 @@ def register(request):
         if password1 != password2:
             messages.error(request, "Passwords do not match.")
             return redirect('register')
-        if User.objects.filter(username__iexact=username).exists():
+        taken = list(users_matching(username=username, email=email).values_list('username', flat=True)[:2])
+        if any(name.lower() == username.lower() for name in taken):
             messages.error(request, "Username already exists.")
             return redirect('register')
-        if User.objects.filter(email__iexact=email).exists():
+        if taken:
             messages.error(request, "Email already registered.")
             return redirect('register')
 
         try:
-            user = User.objects.create_user(username=username, email=email, password=password1)
-            ShopOwnerProfile.objects.create(user=user, image=image)
-            Register.objects.create(user=user)
+            with transaction.atomic():
+                user = User.objects.create_user(username=username, email=email, password=password1)
+                ShopOwnerProfile.objects.create(user=user, image=image)
+                Register.objects.create(user=user)
             messages.success(request, "Registration successful.")
             return redirect('login')
         except IntegrityError:
@@ -79,13 +150,7 @@ def login_view(request):
         if not email or not password:
             messages.error(request, "Please fill in both email and password.")
             return redirect('login')
-        try:
-            user_obj = User.objects.get(email=email)
-        except User.DoesNotExist:
-            messages.error(request, "Invalid email or password.")
-            return redirect('login')
-
-        user = authenticate(request, username=user_obj.username, password=password)
+        user = authenticate(request, email=email, password=password)
         if user:
             login(request, user)
             messages.success(request, "Login successful!")
@@ -122,37 +187,36 @@ def dash(request):
     except ShopOwnerProfile.DoesNotExist:
         user_data = None
 
-    coupons_created = Coupon.objects.filter(owner=user_data).count() if user_data else 0
-    plan_expiration_date = None
-    try:
-        user_package = UserProfile.objects.get(user=request.user)
-        plan_expiration_date = user_package.plan_expiration_date
-    except UserProfile.DoesNotExist:
-        user_package = None
+    stats = owner_stats(user_data)
+    coupons_created = stats['coupons_created']
+    entitlement = get_entitlement(request)
+    plan_expiration_date = entitlement.plan_expiration_date
 
     free_codes_limit = 10
-    used_free_codes = Coupon.objects.filter(owner=user_data, status='Used').count() if user_data else 0
+    used_free_codes = stats['coupons_used']
     has_free_codes_remaining = (free_codes_limit - used_free_codes) > 0
 
     # Check if user can purchase package and show message
-    if not user_package or not user_package.is_package_active():
+    if not entitlement.is_active:
         if coupons_created >= free_codes_limit:
             messages.info(request, "You can purchase a package now. Your package will be activated within 24 hours after purchase.")
 
+    trend, prize_trend = owner_trend(user_data.pk) if user_data else ([], [])
     context = {
         'user_data': user_data,
         'coupons_created': coupons_created,
         'plan_expiration_date': plan_expiration_date,
         'has_free_codes_remaining': has_free_codes_remaining,
+        'trend': trend,
+        'trend_max': max([max(d['generated'], d['redeemed'], d['expired']) for d in trend] or [0]) or 1,
+        'prize_trend': prize_trend,
+        'qr_url': reverse('owner_qr', args=[user_data.pk]) if user_data else reverse('qr'),
     }
     return render(request, 'dash.html', context)
 
 
-def generate_unique_coupon_code(length=8):
-    while True:
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
-        if not Coupon.objects.filter(code=code).exists():
-            return code
+def generate_unique_coupon_code():
+    return allocate_coupon_codes(1)[0]
 
 
 @login_required
@@ -166,18 +230,14 @@ def gen(request):
     FREE_COUPONS_LIMIT = 10
     MONTHLY_PACKAGE_COUPONS_LIMIT = 1000
 
-    try:
-        user_package = UserProfile.objects.get(user=request.user)
-        package_active = user_package.is_package_active()
-        plan_expiration_date = user_package.plan_expiration_date
-    except UserProfile.DoesNotExist:
-        package_active = False
-        plan_expiration_date = None
-
-    coupons_queryset = Coupon.objects.filter(owner=user_profile)
-    coupons_created = coupons_queryset.count()
-    coupons_used = coupons_queryset.filter(status='Used').count()
-    prizes_redeemed = CustomerWinner.objects.filter(coupon__owner=user_profile).count()
+    entitlement = get_entitlement(request)
+    package_active = entitlement.is_active
+    plan_expiration_date = entitlement.plan_expiration_date
+
+    stats = owner_stats(user_profile)
+    coupons_created = stats['coupons_created']
+    coupons_used = stats['coupons_used']
+    prizes_redeemed = stats['prizes_redeemed']
 
     allowed_coupons = (MONTHLY_PACKAGE_COUPONS_LIMIT if package_active else FREE_COUPONS_LIMIT) - coupons_created
     coupons_remaining = max(0, allowed_coupons)
@@ -190,15 +250,16 @@ def gen(request):
 
     if request.method == 'POST':
         if 'delete_all_coupons' in request.POST:
-            coupons_queryset.delete()
-            messages.success(request, "All coupons deleted successfully!")
+            jobs.enqueue(user_profile, jobs.DELETE)
+            messages.success(request, "Your coupons are being deleted in the background.")
             return redirect('gen')
 
         coupon_quantity = int(request.POST.get('coupon_quantity', 0))
         expiry_date = request.POST.get('expiry_date')
         prize_type = request.POST.get('prize_type')
+        signed = request.POST.get('signed_codes') == 'on'
 
-        coupons_created = Coupon.objects.filter(owner=user_profile).count()
+        coupons_created = Coupon.objects.filter(owner=user_profile).count() + jobs.pending_generation(user_profile)
         allowed_coupons = (MONTHLY_PACKAGE_COUPONS_LIMIT if package_active else FREE_COUPONS_LIMIT) - coupons_created
 
         if allowed_coupons <= 0:
@@ -209,22 +270,32 @@ def gen(request):
             messages.error(request, f"You can only create {allowed_coupons} more coupons.")
             return redirect('gen')
 
-        for _ in range(coupon_quantity):
-            code = generate_unique_coupon_code()
-            Coupon.objects.create(
-                code=code,
-                prize_type=prize_type,
-                expiry_date=expiry_date,
-                owner=user_profile
-            )
-        user_profile.total_coupons_created += coupon_quantity
-        user_profile.save()
+        try:
+            if coupon_quantity > getattr(settings, 'JOB_INLINE_COUPONS', 200):
+                # Fail now rather than in the worker.
+                expiry = parse_expiry_date(expiry_date)
+                if signed:
+                    signedcodes.sign(user_profile.pk, user_profile.total_coupons_created + coupon_quantity - 1, expiry)
+                jobs.enqueue(
+                    user_profile, jobs.GENERATE,
+                    quantity=coupon_quantity, expiry_date=expiry_date, prize_type=prize_type, signed=signed,
+                )
+                messages.success(request, f"{coupon_quantity} coupons are being generated in the background.")
+                return redirect('gen')
+            bulk_create_coupons(user_profile, coupon_quantity, expiry_date=expiry_date, prize_type=prize_type, signed=signed)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('gen')
         messages.success(request, f"{coupon_quantity} coupon(s) created successfully!")
         return redirect('gen')
 
+    coupons, next_url = _coupon_page(request, user_profile)
     context = {
         'user_data': user_profile,
-        'coupons': coupons_queryset.order_by('-id'),
+        'coupons': coupons,
+        'next_url': next_url,
+        'filters': request.GET,
+        'status_choices': Coupon.STATUS_CHOICES,
         'coupons_created': coupons_created,
         'user_coupons_used': coupons_used,
         'user_coupons_remaining': coupons_remaining,
@@ -234,10 +305,33 @@ def gen(request):
         'show_purchase_message': show_purchase_message,
         'plan_expiration_date': plan_expiration_date,
         'total_coupons_created': user_profile.total_coupons_created,
+        'active_jobs': Job.objects.filter(owner=user_profile, status__in=(jobs.QUEUED, jobs.RUNNING)).order_by('id'),
     }
     return render(request, 'gen.html', context)
 
 
+def _coupon_page(request, user_profile):
+    coupons = filter_coupons(Coupon.objects.filter(owner=user_profile), request.GET).only(
+        'id', 'code', 'prize_type', 'expiry_date', 'status'
+    )
+    rows, next_cursor = keyset_page(coupons, before=parse_cursor(request.GET.get('before')))
+    next_url = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['before'] = next_cursor
+        next_url = f"{reverse('gen_coupons')}?{params.urlencode()}"
+    return rows, next_url
+
+
+@login_required
+def gen_coupons(request):
+    """JSON fragment with the next page of the coupon table, for infinite scroll."""
+    user_profile = get_object_or_404(ShopOwnerProfile, user=request.user)
+    coupons, next_url = _coupon_page(request, user_profile)
+    html = render_to_string('coupon_rows.html', {'coupons': coupons}, request=request)
+    return JsonResponse({'html': html, 'next': next_url})
+
+
 @staff_member_required
 def delete_all_coupons(request, user_id):
     """
@@ -246,8 +340,8 @@ def delete_all_coupons(request, user_id):
     if request.method == "POST":
         try:
             user_profile = ShopOwnerProfile.objects.get(user__id=user_id)
-            Coupon.objects.filter(owner=user_profile).delete()
-            messages.success(request, f"All coupons for user ID {user_id} deleted successfully!")
+            jobs.enqueue(user_profile, jobs.DELETE)
+            messages.success(request, f"All coupons for user ID {user_id} are being deleted in the background.")
         except ShopOwnerProfile.DoesNotExist:
             messages.error(request, "User profile not found. Cannot delete coupons.")
     return redirect('gen')
@@ -256,14 +350,43 @@ def delete_all_coupons(request, user_id):
 @login_required
 def download(request):
     user_profile = ShopOwnerProfile.objects.get(user=request.user)
-    coupons = Coupon.objects.filter(owner=user_profile)
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="coupons.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Code', 'Prize', 'Expiry Date', 'Status', 'Created At'])
-    for coupon in coupons:
-        writer.writerow([coupon.code, coupon.prize_type, coupon.expiry_date, coupon.status, coupon.created_at])
-    return response
+    coupons = filter_coupons(Coupon.objects.filter(owner=user_profile), request.GET)
+    rows = coupons.order_by('id').values_list(*COUPON_EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return stream_csv(
+        'coupons.csv',
+        COUPON_EXPORT_HEADER,
+        rows,
+        compress=request.GET.get('gzip') == '1',
+    )
+
+
+@login_required
+@require_http_methods(["POST"])
+def export_coupons(request):
+    """Queue a CSV export of the coupons matching the filter form; poll the returned status URL."""
+    user_profile = get_object_or_404(ShopOwnerProfile, user=request.user)
+    filters = {key: value for key, value in request.POST.items() if key in COUPON_FILTER_PARAMS}
+    job = jobs.enqueue(user_profile, jobs.EXPORT, **filters)
+    return JsonResponse(
+        dict(jobs.job_status(job), status_url=reverse('job_status', args=[job.pk])),
+        status=202,
+    )
+
+
+@login_required
+def job_status(request, job_id):
+    job = get_object_or_404(Job, pk=job_id, owner__user=request.user)
+    return JsonResponse(jobs.job_status(job))
+
+
+@login_required
+def job_download(request, job_id):
+    job = get_object_or_404(Job, pk=job_id, owner__user=request.user, kind=jobs.EXPORT, status=jobs.DONE)
+    try:
+        export = open(jobs.export_path(job), 'rb')
+    except FileNotFoundError:
+        raise Http404("This export is no longer available.")
+    return FileResponse(export, as_attachment=True, filename='coupons.csv.gz', content_type='application/gzip')
 
 
 @login_required
@@ -290,34 +413,26 @@ def delete_prize(request, prize_id):
     messages.success(request, f'Prize "{prize.name}" deleted successfully.')
     return redirect('prize')
 
-def qr(request):
-    prizes = Prize.objects.all()
-    return render(request, 'qr.html', {'prizes': prizes})
-
-def validate_coupon(request):
-    code = request.GET.get('coupon', '').strip()
-    if not code:
-        return JsonResponse({'valid': False, 'message': 'Coupon code is required.'})
+def _wheel(owner_id):
+    return [prize for prize in prize_catalogue(owner_id) if is_drawable(prize)]
 
-    if not request.user.is_authenticated:
-        return JsonResponse({'valid': False, 'message': 'Authentication required.'})
 
-    try:
-        user_profile = ShopOwnerProfile.objects.get(user=request.user)
-        coupon_obj = Coupon.objects.get(code=code, status='Active', owner=user_profile)
-        if coupon_obj.expiry_date and coupon_obj.expiry_date < timezone.now().date():
-            return JsonResponse({'valid': False, 'message': 'Coupon expired.'})
-        return JsonResponse({'valid': True, 'message': 'Coupon is valid.'})
-    except (Coupon.DoesNotExist, ShopOwnerProfile.DoesNotExist):
-        return JsonResponse({'valid': False, 'message': 'Coupon invalid, used, or does not belong to you.'})
+def qr(request, owner_id=None):
+    """The customer-facing spin page for one owner; bare /qr/ is the signed-in owner's own."""
+    if owner_id is None:
+        if not request.user.is_authenticated:
+            return redirect('login')
+        owner_id = get_object_or_404(ShopOwnerProfile, user=request.user).pk
+    return render(request, 'qr.html', {'prizes': _wheel(owner_id), 'owner_id': owner_id})
 
 @login_required
 def spin_and_win(request):
     user_profile = ShopOwnerProfile.objects.filter(user=request.user).first()
-    prizes = list(Prize.objects.filter(owner=user_profile))
+    prizes = _wheel(user_profile.pk) if user_profile else []
     context = {
         "prizes": prizes,
         "user_profile": user_profile,
+        "owner_id": user_profile.pk if user_profile else None,
         "name": "",
         "contact": "",
         "coupon": "",
@@ -335,42 +450,25 @@ def spin_and_win(request):
             messages.error(request, "All fields are required.")
             return render(request, "qr.html", context)
 
-        try:
-            coupon_obj = Coupon.objects.get(
-                code=coupon_code, status="Active", owner=user_profile
-            )
-            if coupon_obj.expiry_date and coupon_obj.expiry_date < timezone.now().date():
-                messages.error(request, "Coupon expired.")
-                return render(request, "qr.html", context)
-        except Coupon.DoesNotExist:
-            messages.error(request, "Coupon invalid, used, or not owned by you.")
-            return render(request, "qr.html", context)
-
         if not prizes:
             messages.error(request, "No prizes available currently.")
             return render(request, "qr.html", context)
 
-        prize_won = random.choice(prizes)
-        winning_index = prizes.index(prize_won)
-
-        # Mark coupon as used
-        coupon_obj.status = "Used"
-        coupon_obj.save()
-
-        # Record winner with ownership
-        CustomerWinner.objects.create(
-            customer_name=name,
-            mobile_number=contact,
-            coupon=coupon_obj,
-            prize=prize_won,
-            owner=user_profile,
-        )
+        result = redeem_draw(user_profile.pk, coupon_code, name, contact)
+        if not result.success:
+            messages.error(request, result.message)
+            return render(request, "qr.html", context)
 
+        ids = [prize["id"] for prize in prizes]
+        if result.winner.prize_id not in ids:
+            # The draw ran into a prize change; show the current wheel.
+            prizes = context["prizes"] = _wheel(user_profile.pk)
+            ids = [prize["id"] for prize in prizes]
         context.update(
             {
                 "show_modal": True,
-                "prize_won": prize_won,
-                "winning_index": winning_index,
+                "prize_won": result.winner.prize,
+                "winning_index": ids.index(result.winner.prize_id) if result.winner.prize_id in ids else None,
             }
         )
 
@@ -379,13 +477,14 @@ def spin_and_win(request):
 
 @csrf_exempt
 def redeem_coupon(request):
+    """Public kiosk redemption. The server always draws the prize, by weight,
+    from the cached catalogue; a client-sent prize_id is ignored."""
     if request.method != "POST":
         return JsonResponse({"success": False, "message": "Invalid request method."})
 
     code = request.POST.get("coupon")
     name = request.POST.get("name")
     contact = request.POST.get("contact")
-    prize_id = request.POST.get("prize_id")
     owner_id = request.POST.get("owner_id")
 
     # Fallback: Try to infer owner from coupon if missing
@@ -395,37 +494,51 @@ def redeem_coupon(request):
         except Coupon.DoesNotExist:
             owner_id = None
 
-    if not all([code, name, contact, prize_id, owner_id]):
+    if not all([code, name, contact, owner_id]):
         return JsonResponse({"success": False, "message": "All fields are required."})
 
     try:
-        coupon_obj = Coupon.objects.get(code=code, status="Active", owner_id=owner_id)
-    except Coupon.DoesNotExist:
-        return JsonResponse(
-            {"success": False, "message": "Coupon invalid, used, or not owned."}
-        )
+        result = redeem_draw(int(owner_id), code, name, contact)
+    except (ValueError, DatabaseError) as e:
+        return JsonResponse({"success": False, "message": f"Redemption failed: {str(e)}"})
+    return JsonResponse(dict(result.as_json(), prize_id=result.winner.prize_id if result.winner else None))
 
-    try:
-        prize_obj = Prize.objects.get(pk=prize_id, owner_id=owner_id)
-    except Prize.DoesNotExist:
-        return JsonResponse({"success": False, "message": "Prize does not exist."})
 
-    try:
-        coupon_obj.status = "Used"
-        coupon_obj.save()
+@login_required
+@require_http_methods(['POST'])
+def batch_coupons(request):
+    """Validate or redeem up to MAX_BATCH_ITEMS coupons in one call (POS scans, offline kiosk sync).
 
-        customer_owner = ShopOwnerProfile.objects.get(id=owner_id)
+    Body: {"action": "validate" | "redeem", "items": [{"code", "name", "contact", "prize_id"}, ...]},
+    sent as application/json with the session's CSRF token in X-CSRFToken.
+    """
+    if request.content_type != "application/json":
+        return JsonResponse({"success": False, "message": "Expected an application/json body."}, status=415)
+    try:
+        payload = json.loads(request.body)
+        items = payload["items"]
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({"success": False, "message": "Expected a JSON object with an items list."}, status=400)
+    action = payload.get("action", "redeem")
+    if action not in ("validate", "redeem") or not isinstance(items, list) \
+            or not all(isinstance(item, dict) for item in items):
+        return JsonResponse({"success": False, "message": "Expected a JSON object with an items list."}, status=400)
+    if len(items) > MAX_BATCH_ITEMS:
+        return JsonResponse({"success": False, "message": f"At most {MAX_BATCH_ITEMS} items per batch."}, status=400)
+
+    owner_id = ShopOwnerProfile.objects.filter(user=request.user).values_list("id", flat=True).first()
+    if owner_id is None:
+        return JsonResponse({"success": False, "message": "User profile not found."}, status=400)
 
-        CustomerWinner.objects.create(
-            customer_name=name,
-            mobile_number=contact,
-            coupon=coupon_obj,
-            prize=prize_obj,
-            owner=customer_owner,
-        )
-        return JsonResponse({"success": True})
-    except Exception as e:
+    try:
+        results = redeem_batch(owner_id, items, commit=action == "redeem")
+    except DatabaseError as e:
         return JsonResponse({"success": False, "message": f"Redemption failed: {str(e)}"})
+    return JsonResponse({
+        "success": True,
+        "results": [dict(result.as_json(), code=item.get("code")) for item, result in zip(items, results)],
+        "summary": Counter(result.status for result in results),
+    })
 
 
 @login_required
@@ -434,16 +547,72 @@ def validate_coupon(request):
     if not code:
         return JsonResponse({"valid": False, "message": "Coupon code required."})
 
-    user_profile = ShopOwnerProfile.objects.filter(user=request.user).first()
-    try:
-        coupon_obj = Coupon.objects.get(code=code, status="Active", owner=user_profile)
-        if coupon_obj.expiry_date and coupon_obj.expiry_date < timezone.now().date():
-            return JsonResponse({"valid": False, "message": "Coupon expired."})
+    owner_id = owner_id_for(request)
+    # Signed codes carry their owner and expiry, so they are checked with no
+    # coupon query at all; whether one is already used is settled on redeem.
+    if signedcodes.is_signed(code):
+        return verdict_response(check_signed(code, owner_id) if owner_id else INVALID)
+
+    if not owner_id:
+        return coupon_verdict(None)
+    # Most kiosk lookups are for codes that were never issued; answer those
+    # from the in-process filter without any query.
+    if not codefilter.might_exist(owner_id, code):
+        return coupon_verdict(None)
+
+    coupon_obj = Coupon.objects.filter(code=code, owner_id=owner_id).values("status", "expiry_date").first()
+    if coupon_obj is None:
+        codefilter.record_false_positive()
+    return coupon_verdict(coupon_obj)
+
+
+def owner_id_for(request):
+    """The current user's ShopOwnerProfile id, remembered in the session."""
+    owner_id = request.session.get("_owner_id")
+    if owner_id is None:
+        owner_id = ShopOwnerProfile.objects.filter(user=request.user).values_list("id", flat=True).first()
+        if owner_id is not None:
+            request.session["_owner_id"] = owner_id
+    return owner_id
+
+
+def verdict_response(status):
+    if status == VALID:
         return JsonResponse({"valid": True, "message": "Coupon valid."})
-    except Coupon.DoesNotExist:
-        return JsonResponse(
-            {"valid": False, "message": "Coupon invalid, used, or not owned by you."}
-        )
+    if status == EXPIRED:
+        return JsonResponse({"valid": False, "message": "Coupon expired."})
+    return JsonResponse({"valid": False, "message": "Coupon invalid, used, or not owned by you."})
+
+
+def coupon_verdict(coupon_obj):
+    """validate_coupon's JSON answer for a `values("status", "expiry_date")` row, or None."""
+    if coupon_obj is None or coupon_obj["status"] != "Active":
+        return verdict_response(INVALID)
+    if coupon_obj["expiry_date"] and coupon_obj["expiry_date"] < timezone.now().date():
+        return verdict_response(EXPIRED)
+    return verdict_response(VALID)
+
+
+@staff_member_required
+def code_filter_stats(request):
+    return JsonResponse(codefilter.snapshot())
+
+
+def _prize_odds(data, prize=None):
+    """`(weight, stock)` from a prize form, defaulting to `prize`'s; a blank stock means unlimited.
+
+    Raises ValueError for anything that isn't a non-negative integer.
+    """
+    weight = data.get("weight", "").strip()
+    weight = int(weight) if weight else (prize.weight if prize else 1)
+    if "stock" in data:
+        stock = data["stock"].strip()
+        stock = int(stock) if stock else None
+    else:
+        stock = prize.stock if prize else None
+    if weight < 0 or (stock is not None and stock < 0):
+        raise ValueError("Weight and stock can't be negative.")
+    return weight, stock
 
 
 @login_required
@@ -456,12 +625,20 @@ def manage_prizes(request):
         if not (name and image):
             messages.error(request, "Both Prize name and image required.")
             return redirect("manage_prizes")
+        try:
+            weight, stock = _prize_odds(request.POST)
+        except ValueError:
+            messages.error(request, "Weight and stock must be whole numbers of 0 or more.")
+            return redirect("manage_prizes")
 
-        Prize.objects.create(name=name, image=image, owner=user_profile)
+        prize = Prize.objects.create(name=name, image=image, owner=user_profile, weight=weight, stock=stock)
+        schedule_derivatives(prize)
         messages.success(request, "Prize added successfully.")
         return redirect("manage_prizes")
 
-    prizes = Prize.objects.filter(owner=user_profile).order_by("-id")
+    # The cached catalogue isn't refreshed for every unit of stock taken.
+    stock = dict(Prize.objects.filter(owner=user_profile).values_list("pk", "stock"))
+    prizes = [dict(prize, stock=stock.get(prize["id"])) for prize in prize_catalogue(user_profile.pk)[::-1]]
     return render(request, "prize.html", {"prizes": prizes})
 
 
@@ -477,11 +654,21 @@ def update_prize(request, prize_id):
         if not name:
             messages.error(request, "Prize name is required.")
             return redirect("manage_prizes")
+        try:
+            prize.weight, prize.stock = _prize_odds(request.POST, prize)
+        except ValueError:
+            messages.error(request, "Weight and stock must be whole numbers of 0 or more.")
+            return redirect("manage_prizes")
 
         prize.name = name
+        replaced = prize.image.name if image else None
         if image:
             prize.image = image
         prize.save()
+        if image:
+            schedule_derivatives(prize)
+        if replaced:
+            transaction.on_commit(lambda: prize.image.storage.delete(replaced))
         messages.success(request, "Prize updated successfully.")
     return redirect("manage_prizes")
 
@@ -0,0 +1,57 @@
+"""Winners report: filtering and per-prize / per-day totals for an owner's redemptions.
+
+Totals are GROUP BY queries over the filtered rows, so the report never
+loads the winners themselves; the table is paged separately with
+`listing.keyset_page`.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .listing import parse_date_param
+
+WINNER_FILTER_PARAMS = ('from', 'to', 'prize')
+# Most recent days listed in the per-day totals.
+DAILY_TOTALS_DAYS = 31
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_winners(queryset, params):
+    """Narrow a winner queryset by the from/to redemption dates and prize in `params`.
+
+    Dates become bounds on `redeemed_at` itself rather than `__date`
+    lookups, so the (owner, -redeemed_at) index still applies. `prize=none`
+    selects redemptions whose prize has since been deleted.
+    """
+    start = parse_date_param(params.get('from'))
+    if start:
+        queryset = queryset.filter(redeemed_at__gte=_day_start(start))
+    end = parse_date_param(params.get('to'))
+    if end:
+        queryset = queryset.filter(redeemed_at__lt=_day_start(end + timedelta(days=1)))
+    prize = params.get('prize', '')
+    if prize == 'none':
+        queryset = queryset.filter(prize__isnull=True)
+    elif prize.isdecimal():
+        queryset = queryset.filter(prize_id=int(prize))
+    return queryset
+
+
+def winner_totals(queryset):
+    """Return `(per_prize, per_day)` redemption counts for a filtered winner queryset."""
+    queryset = queryset.order_by()
+    per_prize = list(
+        queryset.values('prize_id', 'prize__name').annotate(total=Count('id')).order_by('-total', 'prize__name')
+    )
+    per_day = list(
+        queryset.annotate(day=TruncDate('redeemed_at'))
+        .values('day')
+        .annotate(total=Count('id'))
+        .order_by('-day')[:DAILY_TOTALS_DAYS]
+    )
+    return per_prize, per_day